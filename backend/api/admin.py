@@ -1,10 +1,27 @@
 from django.contrib import admin
 
+from api.documents import flush_rebuild
 from api.form import RequiredInlineFormSet, SubcribeForm
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.models import (Favorite, Ingredient, Recipe, ShoppingCart,
+                            ShoppingListExport, Tag)
 from users.models import Subscribe, User
 
 
+class RebuildDocumentsMixin:
+    """
+    Rebuilds the recipe documents a change touches inside the admin's
+    transaction, once the inlines and many-to-many fields are saved.
+    """
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        flush_rebuild()
+
+    def delete_model(self, request, obj):
+        super().delete_model(request, obj)
+        flush_rebuild()
+
+
 class IngredientInline(admin.TabularInline):
     model = Recipe.ingredients.through
     extra = 0
@@ -13,20 +30,28 @@ class IngredientInline(admin.TabularInline):
 
 
 @admin.register(User)
-class UsersAdmin(admin.ModelAdmin):
-    list_display = ["pk", "email", "username", "first_name", "last_name"]
+class UsersAdmin(RebuildDocumentsMixin, admin.ModelAdmin):
+    list_display = [
+        "pk",
+        "email",
+        "username",
+        "first_name",
+        "last_name",
+        "recipes_count",
+        "followers_count",
+    ]
     search_fields = ["pk", "email", "username", "first_name", "last_name"]
     list_filter = ["email", "username"]
 
 
 @admin.register(Tag)
-class TagsAdmin(admin.ModelAdmin):
+class TagsAdmin(RebuildDocumentsMixin, admin.ModelAdmin):
     list_display = ["pk", "name", "color", "slug"]
     search_fields = ["pk", "name", "color", "slug"]
 
 
 @admin.register(Recipe)
-class RecipesAdmin(admin.ModelAdmin):
+class RecipesAdmin(RebuildDocumentsMixin, admin.ModelAdmin):
     list_display = [
         "pk",
         "author",
@@ -34,6 +59,7 @@ class RecipesAdmin(admin.ModelAdmin):
         "text",
         "cooking_time",
         "in_favorites",
+        "shopping_cart_count",
     ]
     readonly_fields = [
         "in_favorites",
@@ -46,11 +72,11 @@ class RecipesAdmin(admin.ModelAdmin):
 
     @admin.display(description="Избранное")
     def in_favorites(self, obj):
-        return obj.favorite_recipe.count()
+        return obj.favorites_count
 
 
 @admin.register(Ingredient)
-class IngredientsAdmin(admin.ModelAdmin):
+class IngredientsAdmin(RebuildDocumentsMixin, admin.ModelAdmin):
     list_display = ["pk", "name", "measurement_unit"]
     search_fields = ["pk", "name", "measurement_unit"]
 
@@ -67,6 +93,13 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     search_fields = ["pk", "user", "recipe"]
 
 
+@admin.register(ShoppingListExport)
+class ShoppingListExportAdmin(admin.ModelAdmin):
+    list_display = ["pk", "user", "format", "status", "created"]
+    search_fields = ["pk", "user__email", "status"]
+    list_filter = ["status", "format"]
+
+
 @admin.register(Subscribe)
 class SubscribesAdmin(admin.ModelAdmin):
     list_display = ["pk", "user", "author", "created"]
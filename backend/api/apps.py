@@ -3,3 +3,8 @@ from django.apps import AppConfig
 
 class ApiConfig(AppConfig):
     name = "api"
+
+    def ready(self):
+        # Installs the query observer before the first connection opens.
+        import api.middleware  # noqa: F401
+        import api.signals  # noqa: F401
@@ -0,0 +1,176 @@
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.core.cache import caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import Http404, HttpResponse
+from django.utils.cache import patch_vary_headers
+from rest_framework import exceptions, status
+
+from api import toggles
+from api.authentication import CachedTokenAuthentication
+from api.cache import reference_response
+from api.renderers import FastJSONRenderer
+from api.shopping_list import EXPORTERS, get_ingredients
+from api.views import search_ingredients
+
+
+class CacheMiss(Exception):
+    def __init__(self, key):
+        super().__init__(key)
+        self.key = key
+
+
+class CachedOnlyTokenAuthentication(CachedTokenAuthentication):
+    """
+    Parses the header like TokenAuthentication but never queries the
+    database. The cache lookup itself only stays on the event loop when
+    the default cache lives in process memory.
+    """
+
+    def authenticate_credentials(self, key):
+        credentials = self.cached_credentials(key)
+        if credentials is None:
+            raise CacheMiss(key)
+        return credentials
+
+
+async def authenticate(request):
+    if not isinstance(caches["default"], LocMemCache):
+        # Database caches can not be used from the event loop, the other
+        # shared backends would block it.
+        credentials = await sync_to_async(
+            CachedTokenAuthentication().authenticate
+        )(request)
+    else:
+        try:
+            credentials = CachedOnlyTokenAuthentication().authenticate(
+                request
+            )
+        except CacheMiss as miss:
+            credentials = await sync_to_async(
+                CachedTokenAuthentication().authenticate_credentials
+            )(miss.key)
+    if credentials is None:
+        return None
+    request.user, request.auth = credentials
+    return request.user
+
+
+def render(data, status_code=status.HTTP_200_OK):
+    response = HttpResponse(
+        FastJSONRenderer().render(data) if data is not None else b"",
+        status=status_code,
+        content_type="application/json",
+    )
+    return response
+
+
+def error_response(request, exc):
+    response = render({"detail": exc.detail}, exc.status_code)
+    if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+        response["WWW-Authenticate"] = (
+            CachedTokenAuthentication().authenticate_header(request)
+        )
+    return response
+
+
+def async_api_view(methods, label, authenticated=True):
+    """
+    Async counterpart of a DRF action: token authentication, the
+    IsAuthenticated permission and DRF's error bodies. The view returns
+    an HttpResponse or (data, status). DRF 3.12 can not run async views,
+    so these are plain Django views and do not answer OPTIONS. The label
+    names the ViewSet action the view stands in for in the metrics.
+    """
+    allowed = tuple(methods) + (("HEAD",) if "GET" in methods else ())
+    allow = ", ".join(allowed)
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            try:
+                response = await call_view(request, *args, **kwargs)
+            except Http404:
+                response = render(
+                    {"detail": exceptions.NotFound.default_detail},
+                    status.HTTP_404_NOT_FOUND,
+                )
+            except exceptions.APIException as exc:
+                response = error_response(request, exc)
+            response["Allow"] = allow
+            patch_vary_headers(response, ("Accept",))
+            return response
+
+        async def call_view(request, *args, **kwargs):
+            user = await authenticate(request)
+            if authenticated and user is None:
+                raise exceptions.NotAuthenticated()
+            if request.method not in allowed:
+                raise exceptions.MethodNotAllowed(request.method)
+            result = await view(request, *args, **kwargs)
+            if isinstance(result, HttpResponse):
+                return result
+            return render(*result)
+
+        wrapper.csrf_exempt = True
+        wrapper.view_label = label
+        return wrapper
+
+    return decorator
+
+
+@async_api_view(("POST", "DELETE"), "RecipeViewSet.favorite")
+async def favorite(request, pk):
+    return await sync_to_async(toggles.toggle_recipe)(
+        request.user, request.method, "favorite", pk
+    )
+
+
+@async_api_view(("POST", "DELETE"), "RecipeViewSet.shopping_cart")
+async def shopping_cart(request, pk):
+    return await sync_to_async(toggles.toggle_recipe)(
+        request.user, request.method, "shopping_cart", pk
+    )
+
+
+@async_api_view(("POST", "DELETE"), "UserViewSet.subscribe")
+async def subscribe(request, pk):
+    return await sync_to_async(toggles.toggle_subscription)(
+        request.user, request.method, pk
+    )
+
+
+@async_api_view(("GET",), "IngredientViewSet.list", authenticated=False)
+async def ingredients(request):
+    response = await sync_to_async(reference_response)(
+        "ingredients", request, search_ingredients
+    )
+    response.accepted_renderer = FastJSONRenderer()
+    response.accepted_media_type = FastJSONRenderer.media_type
+    response.renderer_context = {}
+    return response.render()
+
+
+@async_api_view(("GET",), "RecipeViewSet.download_shopping_cart")
+async def download_shopping_cart(request):
+    """
+    The file is rendered off the event loop and off the thread that
+    runs the database calls, so a long PDF does not hold up other
+    requests.
+    """
+    exporter = EXPORTERS.get(request.GET.get("format", "pdf"))
+    if exporter is None:
+        return (
+            {"format": [f"Доступные форматы: {', '.join(EXPORTERS)}"]},
+            status.HTTP_400_BAD_REQUEST,
+        )
+    ingredients = await sync_to_async(get_ingredients)(request.user)
+    content = await sync_to_async(exporter.render, thread_sensitive=False)(
+        ingredients
+    )
+    response = HttpResponse(content, content_type=exporter.content_type)
+    response["Content-Disposition"] = (
+        f'attachment; filename="{exporter.filename}"'
+    )
+    return response
@@ -0,0 +1,133 @@
+import copy
+import threading
+import time
+from collections import OrderedDict, defaultdict
+
+from django.conf import settings
+from django.db import transaction
+from rest_framework.authentication import TokenAuthentication
+
+from api.cache import bump_version, get_version
+
+
+class TokenCache:
+    """
+    Bounded LRU of token key -> (user, token, generation, expiry), shared
+    by the threads of a worker.
+    """
+
+    def __init__(self, size, timeout):
+        self.size = size
+        self.timeout = timeout
+        self.lock = threading.Lock()
+        self.entries = OrderedDict()
+        self.keys_by_user = defaultdict(set)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            if entry[3] < time.monotonic():
+                self.discard(key)
+                return None
+            self.entries.move_to_end(key)
+            return entry
+
+    def set(self, key, user, token, generation):
+        with self.lock:
+            self.discard(key)
+            self.entries[key] = (
+                user,
+                token,
+                generation,
+                time.monotonic() + self.timeout,
+            )
+            self.keys_by_user[user.id].add(key)
+            while len(self.entries) > self.size:
+                self.discard(next(iter(self.entries)))
+
+    def discard(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        keys = self.keys_by_user[entry[0].id]
+        keys.discard(key)
+        if not keys:
+            del self.keys_by_user[entry[0].id]
+
+    def evict_user(self, user_id):
+        with self.lock:
+            for key in list(self.keys_by_user.get(user_id, ())):
+                self.discard(key)
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.keys_by_user.clear()
+
+
+token_cache = TokenCache(
+    settings.TOKEN_CACHE_SIZE, settings.TOKEN_CACHE_TIMEOUT
+)
+
+
+def auth_namespace(user_id):
+    return f"auth:{user_id}"
+
+
+def invalidate_tokens(user_id):
+    """
+    Evicts the user here at commit and bumps the generation, which other
+    workers see when the default cache is shared.
+    """
+
+    def invalidate():
+        token_cache.evict_user(user_id)
+        bump_version(auth_namespace(user_id))
+
+    transaction.on_commit(invalidate)
+
+
+class CachedTokenAuthentication(TokenAuthentication):
+    """
+    TokenAuthentication without the token query on repeated requests.
+    Every request gets its own copy of the cached user.
+    """
+
+    def cached_credentials(self, key):
+        entry = token_cache.get(key)
+        if entry is None:
+            return None
+        user, token, generation = entry[:3]
+        if generation != get_version(auth_namespace(user.id)):
+            return None
+        return copy.copy(user), token
+
+    def current_generation(self, key):
+        """
+        Read before the token and user are loaded, so a logout racing with
+        the load can only be stored under the generation it already bumped.
+        """
+        entry = token_cache.get(key)
+        if entry is not None:
+            user_id = entry[0].id
+        else:
+            user_id = (
+                self.get_model()
+                .objects.filter(key=key)
+                .values_list("user_id", flat=True)
+                .first()
+            )
+            if user_id is None:
+                return None
+        return get_version(auth_namespace(user_id))
+
+    def authenticate_credentials(self, key):
+        credentials = self.cached_credentials(key)
+        if credentials is not None:
+            return credentials
+        generation = self.current_generation(key)
+        user, token = super().authenticate_credentials(key)
+        token_cache.set(key, user, token, generation)
+        return copy.copy(user), token
@@ -0,0 +1,193 @@
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import transaction
+from django.utils.http import parse_etags, quote_etag, urlencode
+from rest_framework import status
+from rest_framework.response import Response
+
+from api.renderers import FastJSONRenderer
+
+
+def version_key(namespace):
+    return f"version:{namespace}"
+
+
+def get_version(namespace, backend=cache):
+    """
+    Current generation of a cached namespace. Starts from a timestamp,
+    so an evicted counter never reuses an old generation.
+    """
+    key = version_key(namespace)
+    version = backend.get(key)
+    if version is None:
+        backend.add(key, time.time_ns(), None)
+        version = backend.get(key)
+    return version
+
+
+def bump_version(namespace, backend=cache):
+    try:
+        backend.incr(version_key(namespace))
+    except ValueError:
+        backend.add(version_key(namespace), time.time_ns(), None)
+
+
+def response_cache():
+    return caches[settings.RESPONSE_CACHE_ALIAS]
+
+
+def invalidate_responses(namespace):
+    """
+    Bumped after commit, so a request can not cache the old rows
+    under the new generation.
+    """
+    transaction.on_commit(
+        lambda: bump_version(namespace, response_cache())
+    )
+
+
+def stat_key(name):
+    return f"response_cache:{name}"
+
+
+def count_stat(backend, name):
+    try:
+        backend.incr(stat_key(name))
+    except ValueError:
+        backend.add(stat_key(name), 1, None)
+
+
+def get_stats():
+    backend = response_cache()
+    return {
+        name: backend.get(stat_key(name), 0) for name in ("hits", "misses")
+    }
+
+
+def reset_stats():
+    response_cache().delete_many([stat_key("hits"), stat_key("misses")])
+
+
+def normalize_query(query_params):
+    return urlencode(
+        sorted(
+            (name, value)
+            for name in query_params
+            for value in query_params.getlist(name)
+        )
+    )
+
+
+def reference_key(namespace, request):
+    return "reference:{}:{}:{}".format(
+        namespace, get_version(namespace), request.get_full_path()
+    )
+
+
+def reference_entry(data):
+    """
+    (data, ETag) cached for a reference response.
+    """
+    content = FastJSONRenderer().render(data)
+    return data, quote_etag(hashlib.sha1(content).hexdigest())
+
+
+def is_not_modified(request, etag):
+    etags = parse_etags(request.headers.get("If-None-Match", ""))
+    return etag in etags or "*" in etags
+
+
+def set_reference_headers(response, etag):
+    response["ETag"] = etag
+    response["Cache-Control"] = (
+        f"public, max-age={settings.REFERENCE_MAX_AGE}"
+    )
+    return response
+
+
+def reference_response(namespace, request, view, *args, **kwargs):
+    """
+    Response of the view cached per namespace generation, or 304 when
+    the client has the same ETag.
+    """
+    key = reference_key(namespace, request)
+    entry = cache.get(key)
+    if entry is None:
+        response = view(request, *args, **kwargs)
+        if response.status_code != status.HTTP_200_OK:
+            return response
+        entry = reference_entry(response.data)
+        cache.set(key, entry, settings.REFERENCE_CACHE_TIMEOUT)
+    data, etag = entry
+    if is_not_modified(request, etag):
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(data)
+    return set_reference_headers(response, etag)
+
+
+class ReferenceCacheMixin:
+    """
+    Caches list/retrieve responses of small read-only viewsets per
+    namespace generation and answers conditional GETs with 304.
+    """
+
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, super().list, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            request, super().retrieve, *args, **kwargs
+        )
+
+    def cached_response(self, request, view, *args, **kwargs):
+        return reference_response(
+            self.cache_namespace, request, view, *args, **kwargs
+        )
+
+
+class AnonymousCacheMixin:
+    """
+    Caches list/retrieve responses for anonymous users, which depend
+    only on the URL, per generation of the namespace.
+    """
+
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self.anonymous_response(
+            request, super().list, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.anonymous_response(
+            request, super().retrieve, *args, **kwargs
+        )
+
+    def anonymous_response(self, request, view, *args, **kwargs):
+        if request.user.is_authenticated:
+            return view(request, *args, **kwargs)
+        backend = response_cache()
+        key = "response:{}:{}:{}?{}".format(
+            self.cache_namespace,
+            get_version(self.cache_namespace, backend),
+            request.build_absolute_uri(request.path),
+            normalize_query(request.query_params),
+        )
+        data = backend.get(key)
+        if data is not None:
+            count_stat(backend, "hits")
+            response = Response(data)
+            response["X-Cache"] = "HIT"
+            return response
+        count_stat(backend, "misses")
+        response = view(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            backend.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        response["X-Cache"] = "MISS"
+        return response
@@ -0,0 +1,180 @@
+import logging
+import operator
+import threading
+from functools import reduce
+
+from django.db import transaction
+from django.db.models import Q
+
+from api.cache import invalidate_responses
+from recipes.models import Recipe
+
+TAG_FIELDS = ("id", "name", "color", "slug")
+AUTHOR_FIELDS = ("email", "id", "username", "first_name", "last_name")
+INGREDIENT_FIELDS = ("id", "name", "measurement_unit", "amount")
+REBUILD_BATCH_SIZE = 200
+
+logger = logging.getLogger(__name__)
+
+
+def build_document(recipe):
+    """
+    The parts of RecipeReadSerializer output that come from other tables
+    and do not depend on the request. Expects the relations prefetched.
+    """
+    return {
+        "tags": [
+            {field: getattr(tag, field) for field in TAG_FIELDS}
+            for tag in recipe.tags.all()
+        ],
+        "author": {
+            field: getattr(recipe.author, field) for field in AUTHOR_FIELDS
+        },
+        "ingredients": [
+            {
+                "id": item.ingredient.id,
+                "name": item.ingredient.name,
+                "measurement_unit": item.ingredient.measurement_unit,
+                "amount": item.amount,
+            }
+            for item in recipe.ingredients_recipe.all()
+        ],
+    }
+
+
+def build_documents(recipe_ids, lock=False):
+    """
+    {recipe id: document} read with three queries.
+    """
+    recipes = Recipe.objects.filter(id__in=recipe_ids)
+    if lock:
+        recipes = recipes.select_for_update(of=("self",)).order_by("id")
+    recipes = recipes.select_related("author").with_related()
+    return {recipe.id: build_document(recipe) for recipe in recipes}
+
+
+def rebuild_documents(recipe_ids):
+    """
+    Recipe rows are locked while their relations are read, so a rebuild
+    racing with a change to the same recipe can not store a stale
+    document after the rebuild of that change.
+    """
+    with transaction.atomic(savepoint=False):
+        documents = build_documents(recipe_ids, lock=True)
+        Recipe.objects.bulk_update(
+            [
+                Recipe(id=recipe_id, document=document)
+                for recipe_id, document in documents.items()
+            ],
+            ("document",),
+        )
+    return len(documents)
+
+
+class RebuildBatch:
+    """
+    Recipes scheduled within one transaction. Writers rebuild them inside
+    it with flush_rebuild(), whatever is left is rebuilt on commit.
+    """
+
+    def __init__(self):
+        self.recipe_ids = set()
+        self.lookups = []
+        self.flushed = False
+
+    def take(self):
+        recipe_ids = self.recipe_ids
+        if self.lookups:
+            recipe_ids |= set(
+                Recipe.objects.filter(
+                    reduce(operator.or_, self.lookups)
+                ).values_list("id", flat=True)
+            )
+        self.recipe_ids, self.lookups = set(), []
+        return sorted(recipe_ids)
+
+    def rebuild(self, recipe_ids):
+        for start in range(0, len(recipe_ids), REBUILD_BATCH_SIZE):
+            rebuild_documents(recipe_ids[start:start + REBUILD_BATCH_SIZE])
+
+    def flush(self):
+        self.rebuild(self.take())
+        self.flushed = True
+
+    def __call__(self):
+        recipe_ids = []
+        try:
+            recipe_ids = self.take()
+            self.rebuild(recipe_ids)
+        except Exception:
+            # The change is committed already: the request must not fail
+            # and the on_commit hooks after this one must still run.
+            logger.exception("Не удалось пересобрать документы рецептов")
+            reset_documents(recipe_ids or self.recipe_ids)
+        if recipe_ids or self.flushed:
+            # Cached responses may have been rendered from the old
+            # documents after the change was committed.
+            invalidate_responses("recipes")
+
+
+def reset_documents(recipe_ids):
+    """
+    Empty documents are built on the fly when read and filled by
+    rebuild_recipe_documents, so a failed rebuild leaves nothing stale.
+    """
+    try:
+        Recipe.objects.filter(id__in=recipe_ids).update(document={})
+    except Exception:
+        logger.exception(
+            "Документы рецептов %s устарели, выполните "
+            "rebuild_recipe_documents --all",
+            recipe_ids,
+        )
+
+
+pending = threading.local()
+
+
+def current_batch():
+    """
+    The batch registered with the current transaction. A rollback drops
+    the on_commit callbacks and with them the batch it scheduled.
+    """
+    batch = getattr(pending, "batch", None)
+    connection = transaction.get_connection()
+    if batch is None or not any(
+        func is batch for _, func in connection.run_on_commit
+    ):
+        return None
+    return batch
+
+
+def schedule_rebuild(recipe_ids=(), **lookup):
+    """
+    Rebuilds documents by flush_rebuild() or once the current transaction
+    commits, the relations are final by then. Everything scheduled within
+    one transaction is rebuilt together. lookup selects recipes at
+    rebuild time, e.g. author_id=1.
+    """
+    batch = current_batch()
+    registered = batch is not None
+    if not registered:
+        batch = pending.batch = RebuildBatch()
+    batch.recipe_ids.update(recipe_ids)
+    if lookup:
+        batch.lookups.append(Q(**lookup))
+    if not registered:
+        # Runs at once outside a transaction, so it is registered last.
+        transaction.on_commit(batch)
+
+
+def flush_rebuild():
+    """
+    Rebuilds the documents scheduled so far inside the current
+    transaction, so they commit together with the change, and a failure
+    rolls the change back. Called by writers once the relations are
+    written.
+    """
+    batch = current_batch()
+    if batch is not None:
+        batch.flush()
@@ -1,5 +1,6 @@
 from django_filters import rest_framework as filters
 
+from api.recipe_state import get_recipe_state
 from recipes.models import Recipe, Tag
 
 
@@ -24,11 +25,15 @@ class RecipeFilter(filters.FilterSet):
     def is_favorited_filter(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(favorite_recipe__user=user)
+            return queryset.filter(
+                id__in=get_recipe_state(self.request).favorited
+            )
         return queryset
 
     def is_in_shopping_cart_filter(self, queryset, name, value):
         user = self.request.user
         if value and user.is_authenticated:
-            return queryset.filter(shopping_recipe__user=user)
+            return queryset.filter(
+                id__in=get_recipe_state(self.request).in_shopping_cart
+            )
         return queryset
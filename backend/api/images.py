@@ -0,0 +1,145 @@
+import hashlib
+import io
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections, transaction
+from PIL import Image, ImageOps
+
+from api.cache import invalidate_responses
+from recipes.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+VARIANTS_PATH = "variants"
+SOURCE = "source"
+EXTENSIONS = {"webp": "webp", "jpeg": "jpg"}
+
+
+def content_name(content, extension, path=""):
+    digest = hashlib.sha256(content).hexdigest()[:32]
+    name = f"{digest}.{extension}"
+    return f"{path}/{name}" if path else name
+
+
+def resize(image, width):
+    if image.width <= width:
+        return image
+    height = max(1, round(image.height * width / image.width))
+    return image.resize((width, height), Image.LANCZOS)
+
+
+def encode(image, image_format):
+    if image_format == "jpeg" and image.mode != "RGB":
+        background = Image.new("RGB", image.size, "white")
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background.paste(image, mask=image.getchannel("A"))
+        else:
+            background.paste(image.convert("RGB"))
+        image = background
+    buffer = io.BytesIO()
+    image.save(
+        buffer,
+        image_format,
+        quality=settings.RECIPE_IMAGE_QUALITY,
+        optimize=True,
+    )
+    return buffer.getvalue()
+
+
+def build_variants(image_file):
+    """
+    Re-encodes the image at every width of RECIPE_IMAGE_WIDTHS.
+    Returns {variant: {format: storage name}} and the name of the
+    original under "source".
+    """
+    with image_file.open("rb") as f:
+        image = ImageOps.exif_transpose(Image.open(f))
+        image.load()
+    variants = {SOURCE: image_file.name}
+    for variant, width in settings.RECIPE_IMAGE_WIDTHS.items():
+        resized = resize(image, width)
+        variants[variant] = {}
+        for image_format in settings.RECIPE_IMAGE_FORMATS:
+            content = encode(resized, image_format)
+            name = content_name(
+                content, EXTENSIONS[image_format], VARIANTS_PATH
+            )
+            if not default_storage.exists(name):
+                default_storage.save(name, ContentFile(content))
+            variants[variant][image_format] = name
+    return variants
+
+
+def pick_variant(variants, variant):
+    """
+    Storage name of the first available format of the variant.
+    """
+    formats = variants.get(variant, {})
+    for image_format in settings.RECIPE_IMAGE_FORMATS:
+        if image_format in formats:
+            return formats[image_format]
+    return None
+
+
+def recipe_image_url(image_name, variants, variant, request=None):
+    """
+    URL of the variant, or of the original upload while the variants of
+    this image are not built yet. Absolute when the request is given, as
+    ImageField does.
+    """
+    name = image_name
+    if variants.get(SOURCE) == image_name:
+        name = pick_variant(variants, variant) or image_name
+    if not name:
+        return None
+    url = default_storage.url(name)
+    if request is not None:
+        return request.build_absolute_uri(url)
+    return url
+
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.RECIPE_IMAGE_WORKERS,
+    thread_name_prefix="recipe-image",
+)
+
+
+def process_recipe_image(recipe_id, image_name):
+    """
+    Builds the variants of a recipe image on the executor. The result
+    is dropped if the recipe got another image in the meantime.
+    """
+    close_old_connections()
+    try:
+        recipe = Recipe.objects.only("image").get(id=recipe_id)
+        if recipe.image.name != image_name:
+            return
+        variants = build_variants(recipe.image)
+        Recipe.objects.filter(id=recipe_id, image=image_name).update(
+            image_variants=variants
+        )
+        invalidate_responses("recipes")
+    except Recipe.DoesNotExist:
+        pass
+    except Exception:
+        logger.exception("Не удалось обработать картинку %s", image_name)
+    finally:
+        close_old_connections()
+
+
+def variants_outdated(recipe):
+    return bool(recipe.image) and (
+        recipe.image_variants.get(SOURCE) != recipe.image.name
+    )
+
+
+def enqueue_recipe_image(recipe):
+    recipe_id, image_name = recipe.id, recipe.image.name
+    transaction.on_commit(
+        lambda: executor.submit(process_recipe_image, recipe_id, image_name)
+    )
@@ -0,0 +1,92 @@
+import threading
+import time
+from bisect import bisect_left
+
+from django.conf import settings
+
+from api.cache import get_version
+from recipes.models import Ingredient
+
+
+def normalize(value):
+    return " ".join(value.casefold().replace("ё", "е").split())
+
+
+def index_queryset():
+    return Ingredient.objects.order_by("id").values(
+        "id", "name", "measurement_unit"
+    )
+
+
+class IngredientIndex:
+    """
+    Process-local sorted array of ingredient names for autocomplete.
+    Prefix lookups are two bisections, so no query hits the database.
+    Rebuilt when the "ingredients" generation moves, so a change made by
+    another process reaches it through a shared cache.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+        self._version = None
+        self._built = 0
+
+    def invalidate(self):
+        self._snapshot = None
+
+    def _load(self):
+        rows = list(index_queryset())
+        ordered = sorted(
+            rows, key=lambda row: (normalize(row["name"]), row["id"])
+        )
+        return (
+            [normalize(row["name"]) for row in ordered],
+            ordered,
+            rows,
+        )
+
+    def snapshot(self):
+        # Read before the rows, a change racing with the load moves the
+        # generation past the one stored with them.
+        version = get_version("ingredients")
+        snapshot = self._snapshot
+        if (
+            snapshot is None
+            or self._version != version
+            or time.monotonic() - self._built > settings.INGREDIENT_INDEX_TTL
+        ):
+            with self._lock:
+                if self._snapshot is snapshot:
+                    self._snapshot = self._load()
+                    self._version = version
+                    self._built = time.monotonic()
+                snapshot = self._snapshot
+        return snapshot
+
+    def all(self):
+        return self.snapshot()[2]
+
+    def search(self, query, limit=None):
+        """
+        Ingredients whose name starts with the query, sorted by name,
+        topped up with names that only contain it.
+        """
+        limit = limit or settings.INGREDIENT_SEARCH_LIMIT
+        keys, items, _ = self.snapshot()
+        key = normalize(query)
+        if not key:
+            return items[:limit]
+        start = bisect_left(keys, key)
+        end = bisect_left(keys, key + "\uffff", start)
+        result = items[start:min(end, start + limit)]
+        if len(result) < limit:
+            for name, item in zip(keys, items):
+                if key in name and not name.startswith(key):
+                    result.append(item)
+                    if len(result) == limit:
+                        break
+        return result
+
+
+ingredient_index = IngredientIndex()
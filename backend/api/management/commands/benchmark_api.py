@@ -0,0 +1,578 @@
+import base64
+import io
+import json
+import os
+import random
+import tempfile
+import time
+
+from django.contrib.auth.hashers import make_password
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import (CaptureQueriesContext, override_settings,
+                               setup_test_environment,
+                               teardown_test_environment)
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api import images, shopping_list
+from api.urls import router_no_put_v1
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, ShoppingListExport, Tag)
+from users.models import Subscribe, User
+
+API_PREFIX = "/api/"
+PASSWORD = "Bench-password-1"
+NEW_PASSWORD = "Bench-password-2"
+
+
+def percentile(values, percent):
+    ordered = sorted(values)
+    index = max(0, int(round(percent / 100 * len(ordered))) - 1)
+    return ordered[index]
+
+
+def image_payload():
+    with open(os.path.join("media", "images", "temp.png"), "rb") as f:
+        return "data:image/png;base64," + base64.b64encode(f.read()).decode()
+
+
+class ImmediateExecutor:
+    """
+    Runs shopping list exports and image processing inline, so background jobs
+    do not compete with the measured requests for the database.
+    """
+
+    def submit(self, fn, *args, **kwargs):
+        fn(*args, **kwargs)
+
+
+def seed(options):
+    """
+    Fills the (test) database with a synthetic, reproducible dataset.
+    """
+    rnd = random.Random(options["seed"])
+    password = make_password(PASSWORD)
+    users = User.objects.bulk_create(
+        User(
+            email=f"bench{i}@example.com",
+            username=f"bench{i}",
+            first_name="Имя",
+            last_name="Фамилия",
+            password=password,
+        )
+        for i in range(options["users"])
+    )
+    if not users[0].pk:
+        users = list(User.objects.order_by("id"))
+    tags = Tag.objects.bulk_create(
+        Tag(name=f"Тег {i}", color=f"#{i:06X}", slug=f"tag{i}")
+        for i in range(options["tags"])
+    )
+    if not tags[0].pk:
+        tags = list(Tag.objects.order_by("id"))
+    with open(
+        os.path.join("data", "ingredients.json"), "r", encoding="utf-8"
+    ) as f:
+        rows = json.load(f)[: options["ingredients"]]
+    Ingredient.objects.bulk_create(
+        Ingredient(name=row["name"], measurement_unit=row["measurement_unit"])
+        for row in rows
+    )
+    ingredients = list(Ingredient.objects.values_list("id", flat=True))
+    Recipe.objects.bulk_create(
+        Recipe(
+            author=users[i % len(users)],
+            name=f"Рецепт {i}",
+            image="images/temp.png",
+            text="Описание рецепта " * 20,
+            cooking_time=rnd.randint(1, 120),
+        )
+        for i in range(options["recipes"])
+    )
+    recipes = list(Recipe.objects.values_list("id", flat=True))
+    through = Recipe.tags.through
+    through.objects.bulk_create(
+        through(recipe_id=recipe, tag_id=tag.id)
+        for recipe in recipes
+        for tag in rnd.sample(tags, min(2, len(tags)))
+    )
+    IngredientRecipe.objects.bulk_create(
+        IngredientRecipe(recipe_id=recipe, ingredient_id=ingredient, amount=n)
+        for recipe in recipes
+        for n, ingredient in enumerate(
+            rnd.sample(
+                ingredients,
+                min(options["ingredients_per_recipe"], len(ingredients)),
+            ),
+            start=1,
+        )
+    )
+    for model, count in (
+        (Favorite, options["favorites"]),
+        (ShoppingCart, options["carts"]),
+    ):
+        model.objects.bulk_create(
+            model(user=user, recipe_id=recipe)
+            for user in users
+            for recipe in rnd.sample(recipes, min(count, len(recipes)))
+        )
+    Subscribe.objects.bulk_create(
+        Subscribe(user=user, author=author)
+        for user in users
+        for author in rnd.sample(
+            [other for other in users if other != user],
+            min(options["subscriptions"], len(users) - 1),
+        )
+    )
+    # bulk_create skips the signals that keep the counters.
+    call_command("reconcile_counters", stdout=io.StringIO())
+    return users, tags, ingredients, recipes
+
+
+class Scenarios:
+    """
+    Requests driven against every route of router_no_put_v1.
+    Each scenario is keyed by "<url name> <METHOD>".
+    """
+
+    def __init__(self, users, tags, ingredients, recipes):
+        self.user = users[0]
+        self.tags = tags
+        self.ingredients = ingredients
+        favorited = set(
+            Favorite.objects.filter(user=self.user).values_list(
+                "recipe_id", flat=True
+            )
+        )
+        carted = set(
+            ShoppingCart.objects.filter(user=self.user).values_list(
+                "recipe_id", flat=True
+            )
+        )
+        followed = set(
+            Subscribe.objects.filter(user=self.user).values_list(
+                "author_id", flat=True
+            )
+        )
+        self.recipes = recipes
+        self.own_recipes = list(
+            Recipe.objects.filter(author=self.user).values_list(
+                "id", flat=True
+            )
+        )
+        self.not_favorited = [r for r in recipes if r not in favorited]
+        self.not_carted = [r for r in recipes if r not in carted]
+        self.not_followed = [
+            u.id for u in users[1:] if u.id not in followed
+        ] or [users[1].id]
+        self.created = []
+        self.image = image_payload()
+        self.export = ShoppingListExport.objects.create(user=self.user)
+        shopping_list.run_export(self.export.id)
+
+    def pick(self, items, i):
+        return items[i % len(items)]
+
+    def recipe_data(self, i):
+        return {
+            "name": f"Новый рецепт {i}",
+            "text": "Описание",
+            "cooking_time": 10,
+            "image": self.image,
+            "tags": [self.pick(self.tags, i).id],
+            "ingredients": [
+                {"id": ingredient, "amount": 2}
+                for ingredient in self.ingredients[i % 10:i % 10 + 5]
+            ],
+        }
+
+    def all(self):
+        recipe = self.recipes[0]
+        author = self.pick(self.not_followed, 0)
+        return [
+            ("user-list", "get", lambda i: ("users/", None)),
+            (
+                "user-list",
+                "post",
+                lambda i: (
+                    "users/",
+                    {
+                        "email": f"new{i}@example.com",
+                        "username": f"new{i}",
+                        "first_name": "Имя",
+                        "last_name": "Фамилия",
+                        "password": PASSWORD,
+                    },
+                ),
+            ),
+            ("user-me", "get", lambda i: ("users/me/", None)),
+            (
+                "user-detail",
+                "get",
+                lambda i: (f"users/{author}/", None),
+            ),
+            (
+                "user-subscriptions",
+                "get",
+                lambda i: ("users/subscriptions/?recipes_limit=3", None),
+            ),
+            (
+                "user-subscriptions",
+                "get",
+                lambda i: (
+                    "users/subscriptions/?pagination=cursor&recipes_limit=3",
+                    None,
+                ),
+            ),
+            (
+                "user-subscribe",
+                "post",
+                lambda i: (
+                    f"users/{self.pick(self.not_followed, i)}/subscribe/",
+                    None,
+                ),
+            ),
+            (
+                "user-subscribe",
+                "delete",
+                lambda i: (
+                    f"users/{self.pick(self.not_followed, i)}/subscribe/",
+                    None,
+                ),
+            ),
+            (
+                "user-set-password",
+                "post",
+                lambda i: (
+                    "users/set_password/",
+                    {
+                        "current_password": (PASSWORD, NEW_PASSWORD)[i % 2],
+                        "new_password": (NEW_PASSWORD, PASSWORD)[i % 2],
+                    },
+                ),
+            ),
+            ("recipe-list", "get", lambda i: ("recipes/", None)),
+            (
+                "recipe-list",
+                "get",
+                lambda i: ("recipes/?pagination=cursor", None),
+            ),
+            (
+                "recipe-list",
+                "get",
+                lambda i: (
+                    "recipes/?tags={}&tags={}".format(
+                        self.tags[0].slug, self.tags[-1].slug
+                    ),
+                    None,
+                ),
+            ),
+            (
+                "recipe-list",
+                "get",
+                lambda i: ("recipes/?is_favorited=1", None),
+            ),
+            (
+                "recipe-list",
+                "get",
+                lambda i: ("recipes/?is_in_shopping_cart=1", None),
+            ),
+            (
+                "recipe-list",
+                "get",
+                lambda i: (f"recipes/?author={author}", None),
+            ),
+            (
+                "recipe-list",
+                "post",
+                lambda i: ("recipes/", self.recipe_data(i)),
+            ),
+            (
+                "recipe-detail",
+                "get",
+                lambda i: (f"recipes/{recipe}/", None),
+            ),
+            (
+                "recipe-detail",
+                "patch",
+                lambda i: (
+                    f"recipes/{self.pick(self.own_recipes, i)}/",
+                    self.recipe_data(i),
+                ),
+            ),
+            (
+                "recipe-detail",
+                "delete",
+                lambda i: (f"recipes/{self.pick(self.created, i)}/", None),
+            ),
+            (
+                "recipe-favorite",
+                "post",
+                lambda i: (
+                    f"recipes/{self.pick(self.not_favorited, i)}/favorite/",
+                    None,
+                ),
+            ),
+            (
+                "recipe-favorite",
+                "delete",
+                lambda i: (
+                    f"recipes/{self.pick(self.not_favorited, i)}/favorite/",
+                    None,
+                ),
+            ),
+            (
+                "recipe-shopping-cart",
+                "post",
+                lambda i: (
+                    f"recipes/{self.pick(self.not_carted, i)}/shopping_cart/",
+                    None,
+                ),
+            ),
+            (
+                "recipe-shopping-cart",
+                "delete",
+                lambda i: (
+                    f"recipes/{self.pick(self.not_carted, i)}/shopping_cart/",
+                    None,
+                ),
+            ),
+            (
+                "recipe-download-shopping-cart",
+                "get",
+                lambda i: ("recipes/download_shopping_cart/", None),
+            ),
+            ("tag-list", "get", lambda i: ("tags/", None)),
+            (
+                "tag-detail",
+                "get",
+                lambda i: (f"tags/{self.tags[0].id}/", None),
+            ),
+            (
+                "ingredient-list",
+                "get",
+                lambda i: ("ingredients/", None),
+            ),
+            (
+                "ingredient-list",
+                "get",
+                lambda i: ("ingredients/?name=бан", None),
+            ),
+            (
+                "ingredient-detail",
+                "get",
+                lambda i: (f"ingredients/{self.ingredients[0]}/", None),
+            ),
+            (
+                "shopping-list-export-list",
+                "post",
+                lambda i: ("shopping_list_exports/", {"format": "csv"}),
+            ),
+            (
+                "shopping-list-export-detail",
+                "get",
+                lambda i: (f"shopping_list_exports/{self.export.id}/", None),
+            ),
+            (
+                "shopping-list-export-download",
+                "get",
+                lambda i: (
+                    f"shopping_list_exports/{self.export.id}/download/",
+                    None,
+                ),
+            ),
+        ]
+
+
+def routes():
+    return {
+        (url.name, method)
+        for url in router_no_put_v1.urls
+        if getattr(url.callback, "actions", None)
+        and "format" not in str(url.pattern)
+        for method in url.callback.actions
+        if method != "head"
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic dataset in a test database and measure SQL "
+        "queries, latency and response size of every API route, then "
+        "compare the fast serializers with DRF on the same data"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--tags", type=int, default=5)
+        parser.add_argument("--ingredients", type=int, default=300)
+        parser.add_argument("--recipes", type=int, default=120)
+        parser.add_argument("--ingredients-per-recipe", type=int, default=8)
+        parser.add_argument("--favorites", type=int, default=30)
+        parser.add_argument("--carts", type=int, default=10)
+        parser.add_argument("--subscriptions", type=int, default=8)
+        parser.add_argument(
+            "--repeat",
+            type=int,
+            default=15,
+            help="Requests per scenario.",
+        )
+        parser.add_argument("--seed", type=int, default=1)
+        parser.add_argument(
+            "--output",
+            help="Write results as a JSON baseline to this file.",
+        )
+        parser.add_argument(
+            "--compare",
+            help="Fail if results regress against this JSON baseline.",
+        )
+        parser.add_argument(
+            "--query-tolerance",
+            type=int,
+            default=0,
+            help="Allowed growth of the query count per request.",
+        )
+        parser.add_argument(
+            "--latency-tolerance",
+            type=float,
+            default=0,
+            help="Allowed p95 latency ratio against the baseline, "
+            "0 disables latency checks.",
+        )
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(
+            verbosity=0, autoclobber=True
+        )
+        executors = (shopping_list.executor, images.executor)
+        shopping_list.executor = images.executor = ImmediateExecutor()
+        try:
+            with tempfile.TemporaryDirectory() as media_root:
+                with override_settings(MEDIA_ROOT=media_root):
+                    results = self.run(options)
+        finally:
+            shopping_list.executor, images.executor = executors
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        report = {
+            "dataset": {
+                key: options[key]
+                for key in (
+                    "users",
+                    "tags",
+                    "ingredients",
+                    "recipes",
+                    "ingredients_per_recipe",
+                    "favorites",
+                    "carts",
+                    "subscriptions",
+                    "repeat",
+                    "seed",
+                )
+            },
+            "results": results,
+        }
+        for name, result in results.items():
+            self.stdout.write(
+                "{:<55} {:>4} q {:>9.2f} p50 ms {:>9.2f} p95 ms "
+                "{:>9} B {}".format(
+                    name,
+                    result["queries"],
+                    result["p50_ms"],
+                    result["p95_ms"],
+                    result["bytes"],
+                    result["status"],
+                )
+            )
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                json.dump(report, f, ensure_ascii=False, indent=2)
+                f.write("\n")
+        if options["compare"]:
+            self.compare(report, options)
+
+    def run(self, options):
+        users, tags, ingredients, recipes = seed(options)
+        scenarios = Scenarios(users, tags, ingredients, recipes)
+        client = APIClient()
+        token = Token.objects.create(user=scenarios.user)
+        client.credentials(HTTP_AUTHORIZATION=f"Token {token.key}")
+
+        covered = set()
+        results = {}
+        for route, method, build in scenarios.all():
+            covered.add((route, method))
+            name = f"{route} {method.upper()}"
+            if "?" in build(0)[0]:
+                name += " ?" + build(0)[0].split("?", 1)[1]
+            timings, queries, sizes, statuses = [], [], [], set()
+            for i in range(options["repeat"]):
+                url, data = build(i)
+                with CaptureQueriesContext(connection) as context:
+                    start = time.perf_counter()
+                    response = getattr(client, method)(
+                        API_PREFIX + url, data, format="json"
+                    )
+                    if getattr(response, "streaming", False):
+                        content = b"".join(response.streaming_content)
+                    else:
+                        content = response.content
+                    timings.append((time.perf_counter() - start) * 1000)
+                queries.append(len(context.captured_queries))
+                sizes.append(len(content))
+                statuses.add(response.status_code)
+                if route == "recipe-list" and method == "post":
+                    scenarios.created.append(response.json()["id"])
+            results[name] = {
+                "queries": max(queries),
+                "p50_ms": round(percentile(timings, 50), 3),
+                "p95_ms": round(percentile(timings, 95), 3),
+                "bytes": max(sizes),
+                "status": sorted(statuses),
+            }
+        for route, method in sorted(routes() - covered):
+            self.stderr.write(f"Not benchmarked: {route} {method.upper()}")
+        # The seeded data after the scenarios has favorites, carts,
+        # subscriptions and edited recipes; a mismatch fails the run.
+        call_command(
+            "check_fast_serializers",
+            viewers=options["users"],
+            stdout=self.stdout,
+            stderr=self.stderr,
+        )
+        return results
+
+    def compare(self, report, options):
+        with open(options["compare"], encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline["dataset"] != report["dataset"]:
+            raise CommandError(
+                "Baseline was recorded with another dataset: "
+                f"{baseline['dataset']}"
+            )
+        regressions = []
+        for name, old in baseline["results"].items():
+            new = report["results"].get(name)
+            if new is None:
+                regressions.append(f"{name}: missing")
+                continue
+            if new["queries"] > old["queries"] + options["query_tolerance"]:
+                regressions.append(
+                    f"{name}: {old['queries']} -> {new['queries']} queries"
+                )
+            tolerance = options["latency_tolerance"]
+            if tolerance and new["p95_ms"] > old["p95_ms"] * tolerance:
+                regressions.append(
+                    f"{name}: p95 {old['p95_ms']} -> {new['p95_ms']} ms"
+                )
+        if regressions:
+            raise CommandError(
+                "Performance regressions:\n" + "\n".join(regressions)
+            )
+        self.stdout.write(
+            self.style.SUCCESS("No regressions against baseline")
+        )
@@ -0,0 +1,128 @@
+import datetime
+import io
+import time
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.test import RequestFactory
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from api.fast_serializers import USER_PLAN, subscribed_to
+from api.ingredient_index import ingredient_index
+from api.parsers import FastJSONParser
+from api.recipe_state import EMPTY_STATE
+from api.renderers import FastJSONRenderer, orjson
+from api.serializers import RecipeDocumentSerializer
+from recipes.models import Recipe
+from users.models import Subscribe, User
+
+
+def best_of(function, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        timings.append(time.perf_counter() - start)
+    return min(timings) * 1000 * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare rendering and parsing of API payloads from the database "
+        "with the stdlib JSON renderer and the orjson one"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repeat", type=int, default=50)
+        parser.add_argument(
+            "--limit",
+            type=int,
+            default=100,
+            help="Recipes and users in the list payloads.",
+        )
+
+    def handle(self, *args, **options):
+        if orjson is None:
+            raise CommandError("orjson не установлен")
+        failures = []
+        for name, payload in self.payloads(options["limit"]).items():
+            stdlib = JSONRenderer().render(payload)
+            fast = FastJSONRenderer().render(payload)
+            if stdlib != fast:
+                failures.append(name)
+                continue
+            parsed = JSONParser().parse(io.BytesIO(stdlib))
+            if parsed != FastJSONParser().parse(io.BytesIO(stdlib)):
+                failures.append(f"{name} (parse)")
+                continue
+            render = [
+                best_of(lambda: renderer.render(payload), options["repeat"])
+                for renderer in (JSONRenderer(), FastJSONRenderer())
+            ]
+            parse = [
+                best_of(
+                    lambda: parser.parse(io.BytesIO(stdlib)),
+                    options["repeat"],
+                )
+                for parser in (JSONParser(), FastJSONParser())
+            ]
+            self.stdout.write(
+                "{:<14} {:>9} B  render {:>9.1f} -> {:>8.1f} us ({:>4.1f}x)  "
+                "parse {:>9.1f} -> {:>8.1f} us ({:>4.1f}x)".format(
+                    name,
+                    len(stdlib),
+                    render[0],
+                    render[1],
+                    render[0] / render[1],
+                    parse[0],
+                    parse[1],
+                    parse[0] / parse[1],
+                )
+            )
+        if failures:
+            raise CommandError(
+                "Вывод отличается от JSONRenderer: " + ", ".join(failures)
+            )
+
+    def payloads(self, limit):
+        host = next(
+            (host.lstrip(".") for host in settings.ALLOWED_HOSTS
+             if "*" not in host),
+            "localhost",
+        )
+        request = Request(RequestFactory().get("/api/", HTTP_HOST=host))
+        request.user = AnonymousUser()
+        recipes = Recipe.objects.with_documents(request.user)[:limit]
+        users = User.objects.annotate(
+            is_subscribed=subscribed_to(request.user)
+        )[:limit]
+        return {
+            "ingredients": ingredient_index.all(),
+            "recipes": RecipeDocumentSerializer(
+                recipes,
+                many=True,
+                context={"request": request, "recipe_state": EMPTY_STATE},
+            ).data,
+            "users": USER_PLAN.render_many(users.values(*USER_PLAN.columns)),
+            "subscriptions": list(
+                Subscribe.objects.values("id", "user", "author", "created")[
+                    :limit
+                ]
+            ),
+            "types": {
+                "decimal": Decimal("12.50"),
+                "aware": timezone.now(),
+                "naive": datetime.datetime(2023, 3, 19, 0, 33, 0, 1),
+                "date": datetime.date(2023, 3, 19),
+                "time": datetime.time(0, 33),
+                "lazy": gettext_lazy("Рецепт"),
+                "separators": "строка\u2028абзац\u2029",
+                1: "int key",
+            },
+        }
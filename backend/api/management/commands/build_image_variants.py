@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from api.images import process_recipe_image
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    help = "Build resized variants of recipe images"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Rebuild the recipes that already have variants too.",
+        )
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.order_by("id")
+        if not options["all"]:
+            recipes = recipes.filter(image_variants={})
+        total = 0
+        for recipe_id, image_name in recipes.values_list("id", "image"):
+            process_recipe_image(recipe_id, image_name)
+            total += 1
+        self.stdout.write(
+            self.style.SUCCESS(f"Обработано картинок: {total}")
+        )
@@ -0,0 +1,137 @@
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import BooleanField, Prefetch, Value
+from django.test import RequestFactory
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from api.fast_serializers import (SUBSCRIPTION_PLAN, TAG_PLAN, USER_PLAN,
+                                  render_subscriptions, subscribed_to)
+from api.recipe_state import get_user_state
+from api.serializers import (RecipeDocumentSerializer, RecipeReadSerializer,
+                             TagSerializer, UsersSerializer,
+                             UserSubscriptionsSerializer)
+from recipes.models import Recipe, Tag
+from users.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the same objects with the DRF serializers and with the "
+        "fast paths and compare the JSON byte for byte"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--viewers",
+            type=int,
+            default=5,
+            help="How many users to render as, besides an anonymous one.",
+        )
+        parser.add_argument("--limit", type=int, default=50)
+        parser.add_argument("--recipes-limit", type=int, default=3)
+
+    def handle(self, *args, **options):
+        self.limit = options["limit"]
+        self.recipes_limit = options["recipes_limit"]
+        self.host = next(
+            (host.lstrip(".") for host in settings.ALLOWED_HOSTS
+             if "*" not in host),
+            "localhost",
+        )
+        self.checked = 0
+        self.failures = []
+        self.compare(
+            "tags",
+            TagSerializer(Tag.objects.all(), many=True).data,
+            TAG_PLAN.render_many(Tag.objects.values(*TAG_PLAN.columns)),
+        )
+        viewers = [AnonymousUser()] + list(
+            User.objects.order_by("id")[: options["viewers"]]
+        )
+        for viewer in viewers:
+            self.check_viewer(viewer)
+        for label, expected, actual in self.failures:
+            self.stderr.write(
+                f"{label}:\n  drf:  {expected}\n  fast: {actual}"
+            )
+        if self.failures:
+            raise CommandError(
+                f"Расхождений: {len(self.failures)} из {self.checked}"
+            )
+        self.stdout.write(
+            self.style.SUCCESS(f"Совпадают все {self.checked} ответов")
+        )
+
+    def request(self, viewer):
+        request = Request(RequestFactory().get("/api/", HTTP_HOST=self.host))
+        request.user = viewer
+        return request
+
+    def compare(self, label, expected, actual):
+        self.checked += 1
+        expected = JSONRenderer().render(expected)
+        actual = JSONRenderer().render(actual)
+        if expected != actual:
+            self.failures.append((label, expected, actual))
+
+    def check_viewer(self, viewer):
+        label = viewer.username or "anonymous"
+        request = self.request(viewer)
+        users = User.objects.annotate(is_subscribed=subscribed_to(viewer))
+        users = users[: self.limit]
+        self.compare(
+            f"{label} users",
+            UsersSerializer(
+                users, many=True, context={"request": request}
+            ).data,
+            USER_PLAN.render_many(users.values(*USER_PLAN.columns)),
+        )
+        self.check_recipes(label, viewer, request)
+        if viewer.is_authenticated:
+            self.check_subscriptions(label, viewer, request)
+
+    def check_recipes(self, label, viewer, request):
+        ids = list(Recipe.objects.values_list("id", flat=True)[: self.limit])
+        expected = Recipe.objects.filter(id__in=ids).with_related()
+        actual = Recipe.objects.filter(id__in=ids).with_documents(viewer)
+        context = {
+            "request": request,
+            "recipe_state": get_user_state(viewer),
+        }
+        for image_variant in ("thumbnail", "full"):
+            context["image_variant"] = image_variant
+            self.compare(
+                f"{label} recipes ({image_variant})",
+                RecipeReadSerializer(
+                    expected.with_authors(viewer), many=True, context=context
+                ).data,
+                RecipeDocumentSerializer(
+                    actual, many=True, context=context
+                ).data,
+            )
+
+    def check_subscriptions(self, label, viewer, request):
+        authors = User.objects.filter(following__user=viewer).annotate(
+            is_subscribed=Value(True, output_field=BooleanField())
+        )[: self.limit]
+        rows = list(authors.values(*SUBSCRIPTION_PLAN.columns))
+        author_ids = [author["id"] for author in rows]
+        recipes = Recipe.objects.latest_per_author(
+            author_ids, self.recipes_limit
+        )
+        expected = list(
+            authors.prefetch_related(
+                Prefetch(
+                    "recipes", queryset=recipes, to_attr="limited_recipes"
+                )
+            )
+        )
+        self.compare(
+            f"{label} subscriptions",
+            UserSubscriptionsSerializer(
+                expected, many=True, context={"request": request}
+            ).data,
+            render_subscriptions(rows, recipes),
+        )
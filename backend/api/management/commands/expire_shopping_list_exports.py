@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from api.shopping_list import expire_exports
+from recipes.models import ShoppingListExport
+
+
+class Command(BaseCommand):
+    help = (
+        "Fail shopping list exports left unfinished by a restarted worker "
+        "and delete the ones older than SHOPPING_LIST_EXPORT_TTL"
+    )
+
+    def handle(self, *args, **options):
+        failed, deleted = expire_exports(ShoppingListExport.objects.all())
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Прервано: {failed}, удалено выгрузок: {deleted}"
+            )
+        )
@@ -0,0 +1,135 @@
+import re
+
+from django.core.exceptions import EmptyResultSet
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.models import BooleanField, F, Value
+
+from api.fast_serializers import (SHORT_RECIPE_PLAN, SUBSCRIPTION_PLAN,
+                                  USER_PLAN, subscribed_to)
+from api.filters import RecipeFilter
+from api.ingredient_index import index_queryset
+from api.recipe_state import state_queryset
+from api.shopping_list import shopping_list_queryset
+from recipes.models import Recipe, Tag
+from users.models import User
+
+INDEX_PATTERN = re.compile(
+    r"(?:Index Scan using|Index Only Scan using|Bitmap Index Scan on"
+    r"|USING (?:COVERING )?INDEX|USING INTEGER PRIMARY KEY) ?(\w*)"
+)
+FULL_SCAN_PATTERN = re.compile(
+    r"Seq Scan on (\w+)|SCAN (?:TABLE )?(\w+)$", re.MULTILINE
+)
+
+
+class FakeRequest:
+    def __init__(self, user):
+        self.user = user
+
+
+def hot_queries(user):
+    """
+    Querysets built the same way api/views.py and api/filters.py build them.
+    """
+    recipes = Recipe.objects.with_documents(user)
+    tags = list(Tag.objects.values_list("slug", flat=True)[:2])
+    author_ids = list(
+        User.objects.filter(following__user=user).values_list(
+            "id", flat=True
+        )[:10]
+    )
+
+    def recipe_filter(**params):
+        return RecipeFilter(
+            params, queryset=recipes, request=FakeRequest(user)
+        ).qs
+
+    return [
+        ("recipe list", recipes),
+        ("recipe list by author", recipe_filter(author=user.pk)),
+        ("recipe list by tags", recipe_filter(tags=tags)),
+        ("recipe list favorited", recipe_filter(is_favorited="true")),
+        (
+            "recipe list in shopping cart",
+            recipe_filter(is_in_shopping_cart="true"),
+        ),
+        ("recipe detail", recipes.filter(pk=1)),
+        ("recipe state", state_queryset(user.pk)),
+        (
+            "user list",
+            User.objects.annotate(is_subscribed=subscribed_to(user)).values(
+                *USER_PLAN.columns
+            ),
+        ),
+        (
+            "subscriptions",
+            User.objects.filter(following__user=user)
+            .annotate(
+                subscription_id=F("following__id"),
+                is_subscribed=Value(True, output_field=BooleanField()),
+            )
+            .values(*SUBSCRIPTION_PLAN.columns, "subscription_id"),
+        ),
+        (
+            "subscription recipes",
+            Recipe.objects.filter(author_id__in=author_ids)
+            .latest_per_author(author_ids, 3)
+            .values(*SHORT_RECIPE_PLAN.columns),
+        ),
+        ("ingredient index", index_queryset()),
+        ("shopping list aggregation", shopping_list_queryset(user)),
+    ]
+
+
+class Command(BaseCommand):
+    help = "Run EXPLAIN on the hot API queries and report index usage"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--analyze",
+            action="store_true",
+            help="Use EXPLAIN ANALYZE (PostgreSQL only).",
+        )
+        parser.add_argument(
+            "--plan", action="store_true", help="Print the full plans."
+        )
+
+    def handle(self, *args, **options):
+        user = User.objects.order_by("id").first() or User(pk=0)
+        explain_options = {}
+        if options["analyze"] and connection.vendor == "postgresql":
+            explain_options["analyze"] = True
+        for name, queryset in hot_queries(user):
+            try:
+                plan = queryset.explain(**explain_options)
+            except (EmptyResultSet, IndexError):
+                # An empty id__in filter: Django skips the query entirely.
+                self.stdout.write(f"{name:<30} no query")
+                continue
+            indexes = sorted(
+                {
+                    index or "primary key"
+                    for index in INDEX_PATTERN.findall(plan)
+                }
+            )
+            full_scans = sorted(
+                {
+                    table
+                    for match in FULL_SCAN_PATTERN.findall(plan)
+                    for table in match
+                    if table
+                }
+            )
+            style = self.style.WARNING if full_scans else self.style.SUCCESS
+            self.stdout.write(
+                style(
+                    "{:<30} indexes: {:<60} full scans: {}".format(
+                        name,
+                        ", ".join(indexes) or "-",
+                        ", ".join(full_scans) or "-",
+                    )
+                )
+            )
+            if options["plan"]:
+                self.stdout.write(plan + "\n")
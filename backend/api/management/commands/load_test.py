@@ -0,0 +1,282 @@
+import os
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from rest_framework.authtoken.models import Token
+
+from api.management.commands.benchmark_api import percentile, seed
+from recipes.models import Ingredient
+
+DEPLOYMENTS = {
+    "wsgi": ("backend.wsgi:application", (), "0"),
+    "asgi": (
+        "backend.asgi:application",
+        ("--worker-class", "uvicorn.workers.UvicornWorker"),
+        "1",
+    ),
+}
+STARTUP_TIMEOUT = 30
+LOCMEM_CACHE = "django.core.cache.backends.locmem.LocMemCache"
+DATASET = {
+    "tags": 5,
+    "ingredients": 300,
+    "ingredients_per_recipe": 8,
+    "favorites": 0,
+    "carts": 0,
+    "subscriptions": 0,
+}
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+class Client:
+    """
+    One simulated user: cycles through ingredient search, the favorite,
+    shopping cart and subscription toggles and the shopping list download.
+    """
+
+    def __init__(self, base_url, token, recipe_id, author_id, names):
+        self.base_url = base_url
+        self.headers = {"Authorization": f"Token {token}"}
+        self.names = names
+        self.steps = [
+            ("GET", "ingredients/?name={name}", "ingredient search"),
+            ("POST", f"recipes/{recipe_id}/favorite/", "favorite"),
+            ("DELETE", f"recipes/{recipe_id}/favorite/", "favorite"),
+            ("POST", f"recipes/{recipe_id}/shopping_cart/", "shopping cart"),
+            (
+                "GET",
+                "recipes/download_shopping_cart/?format=txt",
+                "download",
+            ),
+            (
+                "DELETE",
+                f"recipes/{recipe_id}/shopping_cart/",
+                "shopping cart",
+            ),
+            ("POST", f"users/{author_id}/subscribe/", "subscribe"),
+            ("DELETE", f"users/{author_id}/subscribe/", "subscribe"),
+        ]
+
+    def request(self, i):
+        method, url, name = self.steps[i % len(self.steps)]
+        url = url.format(name=self.names[i % len(self.names)])
+        request = urllib.request.Request(
+            self.base_url + urllib.parse.quote(url, safe="/?=&"),
+            method=method,
+            headers=self.headers,
+        )
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                status = response.status
+        except urllib.error.HTTPError as exc:
+            exc.read()
+            status = exc.code
+        except OSError:
+            status = None
+        return name, status, (time.perf_counter() - start) * 1000
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a synthetic dataset in a test database, start the WSGI and the "
+        "ASGI deployment on it with gunicorn and compare sustained RPS and "
+        "tail latency of the I/O-bound endpoints at the same worker count"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--deployments",
+            nargs="+",
+            choices=tuple(DEPLOYMENTS),
+            default=list(DEPLOYMENTS),
+        )
+        parser.add_argument("--workers", type=int, default=2)
+        parser.add_argument(
+            "--concurrency",
+            type=int,
+            default=32,
+            help="Simultaneous clients, each with its own user.",
+        )
+        parser.add_argument(
+            "--duration", type=float, default=20, help="Seconds measured."
+        )
+        parser.add_argument(
+            "--warmup", type=float, default=3, help="Seconds not measured."
+        )
+        parser.add_argument("--recipes", type=int, default=120)
+        parser.add_argument("--seed", type=int, default=1)
+
+    def handle(self, *args, **options):
+        with tempfile.TemporaryDirectory() as tmp:
+            if connection.vendor == "sqlite":
+                # The servers can not open the in-memory test database.
+                connection.settings_dict["TEST"]["NAME"] = os.path.join(
+                    tmp, "load_test.sqlite3"
+                )
+            old_name = connection.creation.create_test_db(
+                verbosity=0, autoclobber=True
+            )
+            try:
+                self.run_deployments(tmp, options)
+            finally:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def run_deployments(self, tmp, options):
+        users, _, _, recipes = seed(
+            dict(
+                DATASET,
+                users=options["concurrency"] + 1,
+                recipes=options["recipes"],
+                seed=options["seed"],
+            )
+        )
+        tokens = [Token.objects.create(user=user).key for user in users]
+        names = [
+            name[:2]
+            for name in Ingredient.objects.values_list("name", flat=True)[
+                :50
+            ]
+        ]
+        env = self.server_env(tmp)
+        for deployment in options["deployments"]:
+            port = free_port()
+            base_url = f"http://127.0.0.1:{port}/api/"
+            clients = [
+                Client(
+                    base_url,
+                    tokens[i],
+                    recipes[i % len(recipes)],
+                    users[i + 1].id,
+                    names,
+                )
+                for i in range(options["concurrency"])
+            ]
+            server = self.start(deployment, port, options["workers"], env)
+            try:
+                self.wait_until_ready(server, base_url)
+                self.run(clients, options["warmup"])
+                results = self.run(clients, options["duration"])
+            finally:
+                server.terminate()
+                server.wait()
+            self.report(deployment, results, options)
+
+    def server_env(self, tmp):
+        """
+        Points the servers at the test database and keeps their metrics
+        and file caches away from those of the running deployment.
+        """
+        metrics_dir = os.path.join(tmp, "prometheus")
+        os.makedirs(metrics_dir)
+        env = dict(
+            os.environ,
+            DB_NAME=connection.settings_dict["NAME"],
+            PROMETHEUS_MULTIPROC_DIR=metrics_dir,
+        )
+        for alias, prefix in (
+            ("default", "CACHE"),
+            ("responses", "RESPONSE_CACHE"),
+            ("shopping_lists", "SHOPPING_LIST_CACHE"),
+        ):
+            backend = settings.CACHES[alias]["BACKEND"]
+            if backend.endswith("FileBasedCache"):
+                env[f"{prefix}_LOCATION"] = os.path.join(tmp, alias)
+            elif not backend.endswith("DatabaseCache"):
+                env[f"{prefix}_BACKEND"] = LOCMEM_CACHE
+        return env
+
+    def start(self, deployment, port, workers, env):
+        app, arguments, async_views = DEPLOYMENTS[deployment]
+        return subprocess.Popen(
+            [
+                "gunicorn",
+                app,
+                # Not gunicorn.conf.py, it clears the live metrics directory.
+                "--config",
+                os.devnull,
+                "--bind",
+                f"127.0.0.1:{port}",
+                "--workers",
+                str(workers),
+                *arguments,
+            ],
+            env=dict(env, ASYNC_VIEWS=async_views),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL,
+        )
+
+    def wait_until_ready(self, server, base_url):
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if server.poll() is not None:
+                raise CommandError("Сервер завершился при запуске")
+            try:
+                with urllib.request.urlopen(base_url + "tags/") as response:
+                    response.read()
+                return
+            except OSError:
+                time.sleep(0.2)
+        raise CommandError("Сервер не запустился")
+
+    def run(self, clients, duration):
+        results = []
+        deadline = time.perf_counter() + duration
+
+        def loop(client):
+            i = 0
+            while time.perf_counter() < deadline:
+                results.append(client.request(i))
+                i += 1
+
+        threads = [
+            threading.Thread(target=loop, args=(client,)) for client in clients
+        ]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def report(self, deployment, results, options):
+        timings = defaultdict(list)
+        errors = 0
+        for name, status, elapsed in results:
+            if status is None or status >= 500:
+                errors += 1
+            timings[name].append(elapsed)
+            timings["total"].append(elapsed)
+        if not timings["total"]:
+            raise CommandError("Нет ни одного ответа")
+        self.stdout.write(
+            f"{deployment}: {options['workers']} workers, "
+            f"{options['concurrency']} clients, {errors} errors"
+        )
+        for name, values in sorted(timings.items()):
+            self.stdout.write(
+                "  {:<18} {:>7} req {:>8.1f} rps {:>8.1f} p50 {:>8.1f} p95 "
+                "{:>8.1f} p99 ms".format(
+                    name,
+                    len(values),
+                    len(values) / options["duration"],
+                    percentile(values, 50),
+                    percentile(values, 95),
+                    percentile(values, 99),
+                )
+            )
@@ -0,0 +1,51 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from api.cache import invalidate_responses
+from api.documents import REBUILD_BATCH_SIZE, rebuild_documents
+from recipes.models import Recipe
+
+
+def rebuild_batch(recipe_ids):
+    try:
+        return rebuild_documents(recipe_ids)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = "Rebuild the prerendered documents of recipes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--all",
+            action="store_true",
+            help="Rebuild the recipes that already have a document too.",
+        )
+        parser.add_argument(
+            "--batch-size", type=int, default=REBUILD_BATCH_SIZE
+        )
+        parser.add_argument("--workers", type=int, default=4)
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.order_by("id")
+        if not options["all"]:
+            recipes = recipes.filter(document={})
+        recipe_ids = list(recipes.values_list("id", flat=True))
+        size = options["batch_size"]
+        batches = [
+            recipe_ids[start:start + size]
+            for start in range(0, len(recipe_ids), size)
+        ]
+        workers = options["workers"]
+        if connection.vendor == "sqlite":
+            # A single writer: parallel transactions would fail to lock.
+            workers = 1
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            total = sum(pool.map(rebuild_batch, batches))
+        invalidate_responses("recipes")
+        self.stdout.write(
+            self.style.SUCCESS(f"Пересобрано документов: {total}")
+        )
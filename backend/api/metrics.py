@@ -0,0 +1,106 @@
+import asyncio
+import os
+import time
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+from django.utils.deprecation import MiddlewareMixin
+from prometheus_client import (CONTENT_TYPE_LATEST, REGISTRY,
+                               CollectorRegistry, Counter, Histogram,
+                               generate_latest, multiprocess)
+
+from api.middleware import collect_queries, view_name
+
+REQUEST_LATENCY = Histogram(
+    "api_request_duration_seconds",
+    "Время обработки запроса",
+    ["view"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+REQUEST_QUERIES = Histogram(
+    "api_request_queries",
+    "Количество SQL запросов на запрос",
+    ["view"],
+    buckets=(1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+RESPONSE_SIZE = Histogram(
+    "api_response_size_bytes",
+    "Размер ответа",
+    ["view"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+PDF_PAGES = Counter(
+    "shopping_list_pdf_pages", "Страниц PDF списка покупок отрисовано"
+)
+IMAGE_BYTES = Counter(
+    "recipe_image_decoded_bytes", "Байт картинок рецептов декодировано"
+)
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+
+    def __call__(self, execute, sql, params, many, context):
+        self.count += 1
+        return execute(sql, params, many, context)
+
+
+def response_size(response):
+    if response.streaming:
+        return response.get("Content-Length")
+    return len(response.content)
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """
+    Observes latency, query count and response size of every API view,
+    in sync and async mode. Under gunicorn every worker writes its own
+    mmap files in PROMETHEUS_MULTIPROC_DIR, and the metrics view merges
+    them.
+    """
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with collect_queries(counter):
+            response = self.get_response(request)
+        return self.observe(request, response, counter, start)
+
+    async def __acall__(self, request):
+        counter = QueryCounter()
+        start = time.perf_counter()
+        with collect_queries(counter):
+            response = await self.get_response(request)
+        return self.observe(request, response, counter, start)
+
+    def observe(self, request, response, counter, start):
+        elapsed = time.perf_counter() - start
+        name = view_name(request)
+        if name == "-":
+            return response
+        REQUEST_LATENCY.labels(name).observe(elapsed)
+        REQUEST_QUERIES.labels(name).observe(counter.count)
+        size = response_size(response)
+        if size is not None:
+            RESPONSE_SIZE.labels(name).observe(int(size))
+        return response
+
+
+def metrics(request):
+    token = settings.METRICS_TOKEN
+    # Closed until a token is configured: nginx proxies /api/ publicly.
+    if not token or not constant_time_compare(
+        request.headers.get("Authorization", ""), f"Bearer {token}"
+    ):
+        return HttpResponseForbidden()
+    registry = REGISTRY
+    if "PROMETHEUS_MULTIPROC_DIR" in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    return HttpResponse(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST
+    )
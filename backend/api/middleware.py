@@ -0,0 +1,165 @@
+import asyncio
+import contextvars
+import logging
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from functools import partial
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger(__name__)
+
+active_collectors = contextvars.ContextVar("active_collectors", default=())
+
+
+def observe_query(execute, sql, params, many, context):
+    """
+    Installed on every database connection. Passes the query through the
+    collectors of the current request, also when it runs in a
+    sync_to_async thread, which inherits the request context.
+    """
+    for collector in active_collectors.get():
+        execute = partial(collector, execute)
+    return execute(sql, params, many, context)
+
+
+def install_query_observer(sender, connection, **kwargs):
+    # The wrapper list outlives the connection, which is reopened after
+    # every request when CONN_MAX_AGE is 0.
+    if observe_query not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, observe_query)
+
+
+connection_created.connect(install_query_observer)
+
+
+@contextmanager
+def collect_queries(collector):
+    """
+    Like connection.execute_wrapper(), but for every connection the
+    request uses, including those of the threads async views delegate to.
+    """
+    token = active_collectors.set(active_collectors.get() + (collector,))
+    try:
+        yield collector
+    finally:
+        active_collectors.reset(token)
+
+
+def view_name(request):
+    """
+    ViewSet.action of the resolved view, e.g. RecipeViewSet.favorite.
+    """
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "-"
+    view = match.func
+    label = getattr(view, "view_label", None)
+    if label is not None:
+        return label
+    view_class = getattr(view, "cls", getattr(view, "view_class", None))
+    if view_class is None:
+        return match.view_name
+    actions = getattr(view, "actions", None) or {}
+    action = actions.get(request.method.lower(), request.method.lower())
+    return f"{view_class.__name__}.{action}"
+
+
+class QueryStats:
+    """
+    connection.execute_wrapper that counts the queries of one request.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0
+        self.statements = Counter()
+        self.slow = []
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = time.perf_counter() - start
+            self.count += 1
+            self.duration += elapsed
+            self.statements[sql] += 1
+            if elapsed * 1000 >= settings.SLOW_QUERY_MS:
+                self.slow.append((elapsed, sql))
+
+    def duplicates(self):
+        return [
+            (count, sql)
+            for sql, count in self.statements.most_common()
+            if count > 1
+        ]
+
+
+class QueryTimingMiddleware(MiddlewareMixin):
+    """
+    For a sample of requests counts queries, database time and repeated
+    SQL, adds a Server-Timing header and logs the slow requests.
+    With REQUEST_TIMING_SAMPLE_RATE = 0 it only calls the next handler.
+    Works in sync and async mode, see MiddlewareMixin.
+    """
+
+    def sampled(self):
+        rate = settings.REQUEST_TIMING_SAMPLE_RATE
+        return rate > 0 and (rate >= 1 or random.random() < rate)
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not self.sampled():
+            return self.get_response(request)
+        stats = QueryStats()
+        start = time.perf_counter()
+        with collect_queries(stats):
+            response = self.get_response(request)
+        return self.finish(request, response, stats, start)
+
+    async def __acall__(self, request):
+        if not self.sampled():
+            return await self.get_response(request)
+        stats = QueryStats()
+        start = time.perf_counter()
+        with collect_queries(stats):
+            response = await self.get_response(request)
+        return self.finish(request, response, stats, start)
+
+    def finish(self, request, response, stats, start):
+        total = time.perf_counter() - start
+        response["Server-Timing"] = (
+            f"db;dur={stats.duration * 1000:.1f};"
+            f'desc="{stats.count} queries", app;dur={total * 1000:.1f}'
+        )
+        if (
+            total * 1000 >= settings.SLOW_REQUEST_MS
+            or stats.count >= settings.SLOW_REQUEST_QUERIES
+            or stats.slow
+        ):
+            self.log(request, response, stats, total)
+        return response
+
+    def log(self, request, response, stats, total):
+        lines = [
+            "{} {} {} {}: {:.1f} ms, {} queries, {:.1f} ms in db".format(
+                view_name(request),
+                request.method,
+                request.get_full_path(),
+                response.status_code,
+                total * 1000,
+                stats.count,
+                stats.duration * 1000,
+            )
+        ]
+        for elapsed, sql in stats.slow:
+            lines.append(f"  slow {elapsed * 1000:.1f} ms: {sql}")
+        for count, sql in stats.duplicates():
+            lines.append(f"  repeated {count}x: {sql}")
+        logger.warning("\n".join(lines))
@@ -1,5 +1,101 @@
-from rest_framework.pagination import PageNumberPagination
+from django.conf import settings
+from django.core.paginator import Paginator
+from django.db import connection
+from django.utils.functional import cached_property
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+
+PAGINATION_CURSOR = "cursor"
+COUNT_ESTIMATE = "estimate"
+
+
+def estimate_count(queryset):
+    """
+    Row count of the model table from pg_class.reltuples.
+    Returns None when the estimate does not apply: another database,
+    a filtered queryset or a table that was never analyzed.
+    """
+    if connection.vendor != "postgresql" or queryset.query.where:
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT reltuples FROM pg_class WHERE oid = %s::regclass",
+            [queryset.model._meta.db_table],
+        )
+        row = cursor.fetchone()
+    if row is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Takes the count from the planner statistics for large tables
+    and falls back to COUNT(*) for everything else.
+    """
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is None or estimate < settings.ESTIMATED_COUNT_THRESHOLD:
+            return super().count
+        return estimate
+
+
+class KeysetPaginator(CursorPagination):
+    """
+    Seeks by the ordering key instead of OFFSET and runs no COUNT(*).
+    Views pick the key with a cursor_ordering attribute.
+    """
+
+    ordering = "-id"
+    page_size_query_param = "limit"
+
+    def get_ordering(self, request, queryset, view):
+        self.ordering = getattr(view, "cursor_ordering", self.ordering)
+        return super().get_ordering(request, queryset, view)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.count = None
+        if request.query_params.get("count") == COUNT_ESTIMATE:
+            self.count = estimate_count(queryset)
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        response = super().get_paginated_response(data)
+        if self.count is not None:
+            response.data["count"] = self.count
+            response.data.move_to_end("count", last=False)
+        return response
 
 
 class CustomPaginator(PageNumberPagination):
+    """
+    Page numbers by default. ?pagination=cursor switches to keyset
+    pagination, ?count=estimate estimates the total of large tables.
+    """
+
     page_size_query_param = "limit"
+    pagination_query_param = "pagination"
+    count_query_param = "count"
+    keyset = None
+
+    def paginate_queryset(self, queryset, request, view=None):
+        mode = request.query_params.get(self.pagination_query_param)
+        if mode == PAGINATION_CURSOR:
+            self.keyset = KeysetPaginator()
+            page = self.keyset.paginate_queryset(queryset, request, view)
+            self.display_page_controls = self.keyset.display_page_controls
+            return page
+        if request.query_params.get(self.count_query_param) == COUNT_ESTIMATE:
+            self.django_paginator_class = EstimatedCountPaginator
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def to_html(self):
+        if self.keyset is not None:
+            return self.keyset.to_html()
+        return super().to_html()
@@ -0,0 +1,87 @@
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
+from django.db import models, transaction
+from django.db.models import Value
+
+from api.cache import bump_version, get_version
+from recipes.models import Favorite, ShoppingCart
+
+
+class RecipeState:
+    """
+    Ids of the recipes a user added to favorites and to the shopping cart.
+    """
+
+    def __init__(self, favorited=(), in_shopping_cart=()):
+        self.favorited = frozenset(favorited)
+        self.in_shopping_cart = frozenset(in_shopping_cart)
+
+
+EMPTY_STATE = RecipeState()
+
+
+def state_namespace(user_id):
+    return f"recipe_state:{user_id}"
+
+
+def state_queryset(user_id):
+    """
+    Both id sets in one UNION ALL query.
+    """
+    return (
+        Favorite.objects.filter(user=user_id)
+        .annotate(cart=Value(False, output_field=models.BooleanField()))
+        .values_list("recipe_id", "cart")
+        .union(
+            ShoppingCart.objects.filter(user=user_id)
+            .annotate(cart=Value(True, output_field=models.BooleanField()))
+            .values_list("recipe_id", "cart"),
+            all=True,
+        )
+    )
+
+
+def load_state(user_id):
+    rows = state_queryset(user_id)
+    favorited, in_shopping_cart = [], []
+    for recipe_id, cart in rows:
+        (in_shopping_cart if cart else favorited).append(recipe_id)
+    return RecipeState(favorited, in_shopping_cart)
+
+
+def get_user_state(user):
+    """
+    Cached across requests per generation when the default cache is
+    shared between the workers. The generation is read
+    before the database, so a load racing with a change can only
+    be stored under the generation that change already bumped.
+    """
+    if not user.is_authenticated:
+        return EMPTY_STATE
+    if isinstance(caches["default"], (LocMemCache, DummyCache)):
+        # Other workers would not see the bump of a per-process cache.
+        return load_state(user.id)
+    namespace = state_namespace(user.id)
+    key = f"{namespace}:{get_version(namespace)}"
+    state = cache.get(key)
+    if state is None:
+        state = load_state(user.id)
+        cache.set(key, state, settings.RECIPE_STATE_CACHE_TIMEOUT)
+    return state
+
+
+def get_recipe_state(request):
+    """
+    Loaded once per request and shared by the filters and serializers.
+    """
+    state = getattr(request, "_recipe_state", None)
+    if state is None:
+        state = get_user_state(request.user)
+        request._recipe_state = state
+    return state
+
+
+def invalidate_state(user_id):
+    transaction.on_commit(lambda: bump_version(state_namespace(user_id)))
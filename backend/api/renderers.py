@@ -0,0 +1,45 @@
+from rest_framework.renderers import JSONRenderer
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = (
+    orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS
+    if orjson is not None
+    else 0
+)
+LINE_SEPARATOR = "\u2028".encode()
+PARAGRAPH_SEPARATOR = "\u2029".encode()
+
+
+class FastJSONRenderer(JSONRenderer):
+    """
+    JSONRenderer that produces the same bytes with orjson when it is
+    installed. Datetimes and the types orjson does not know (Decimal,
+    lazy strings, querysets) go through DRF's encoder. Indented and
+    ASCII-only output is left to the stdlib. Unlike the stdlib orjson
+    writes NaN as null instead of failing, the API has no float fields.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or self.ensure_ascii
+            or not self.compact
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(
+                data, accepted_media_type, renderer_context
+            )
+        ret = orjson.dumps(
+            data, default=self.encoder_class().default, option=ORJSON_OPTIONS
+        )
+        # Escaped by JSONRenderer for the sake of JavaScript.
+        if LINE_SEPARATOR in ret:
+            ret = ret.replace(LINE_SEPARATOR, b"\\u2028")
+        if PARAGRAPH_SEPARATOR in ret:
+            ret = ret.replace(PARAGRAPH_SEPARATOR, b"\\u2029")
+        return ret
@@ -1,12 +1,21 @@
 import base64
+import binascii
+import io
 
+from django.conf import settings
 from django.core.files.base import ContentFile
 from django.core.validators import MinValueValidator
-from django.db.models import F
+from django.db import transaction
+from django.urls import reverse
+from PIL import Image
 from rest_framework import exceptions, serializers
 
+from api.documents import (AUTHOR_FIELDS, INGREDIENT_FIELDS, TAG_FIELDS,
+                           build_documents, flush_rebuild)
+from api.images import content_name, recipe_image_url
+from api.metrics import IMAGE_BYTES
 from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
-                            ShoppingCart, Tag)
+                            ShoppingCart, ShoppingListExport, Tag)
 from users.models import Subscribe, User
 
 
@@ -15,10 +24,63 @@ class Base64ImageField(serializers.ImageField):
         if isinstance(data, str) and data.startswith("data:image"):
             format, imgstr = data.split(";base64,")
             ext = format.split("/")[-1]
-            data = ContentFile(base64.b64decode(imgstr), name="temp." + ext)
+            self.validate_size(len(imgstr) * 3 // 4)
+            try:
+                content = base64.b64decode(imgstr)
+            except binascii.Error:
+                self.fail("invalid_image")
+            IMAGE_BYTES.inc(len(content))
+            self.validate_dimensions(content)
+            data = ContentFile(content, name=content_name(content, ext))
+        elif hasattr(data, "size"):
+            self.validate_size(data.size)
 
         return super().to_internal_value(data)
 
+    def validate_size(self, size):
+        if size > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise serializers.ValidationError(
+                "Размер картинки не должен превышать {} МБ".format(
+                    settings.RECIPE_IMAGE_MAX_SIZE // (1024 * 1024)
+                )
+            )
+
+    def validate_dimensions(self, content):
+        """
+        Reads only the image header, the pixels are not decoded.
+        """
+        try:
+            width, height = Image.open(io.BytesIO(content)).size
+        except Exception:
+            self.fail("invalid_image")
+        if max(width, height) > settings.RECIPE_IMAGE_MAX_DIMENSION:
+            raise serializers.ValidationError(
+                "Стороны картинки не должны превышать {} пикселей".format(
+                    settings.RECIPE_IMAGE_MAX_DIMENSION
+                )
+            )
+
+
+class RecipeImageField(serializers.ImageField):
+    """
+    URL of a resized recipe image, or of the original upload
+    while the variants are not built yet.
+    """
+
+    def __init__(self, variant="full", **kwargs):
+        self.variant = variant
+        kwargs["source"] = "*"
+        kwargs["read_only"] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        return recipe_image_url(
+            recipe.image.name,
+            recipe.image_variants,
+            self.context.get("image_variant", self.variant),
+            self.context.get("request"),
+        )
+
 
 class UsersSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
@@ -51,6 +113,8 @@ class UsersSerializer(serializers.ModelSerializer):
             or self.context.get("request").user.is_anonymous
         ):
             return False
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         return Subscribe.objects.filter(
             author=obj, user=self.context.get("request").user
         ).exists()
@@ -96,14 +160,8 @@ class ChangePasswordSerializer(serializers.Serializer):
         return data
 
 
-class UsersSubscribeSerializer(serializers.Serializer):
-    class Meta:
-        model = Subscribe
-        fields = ("user", "author")
-
-
 class RecipeAuthorShortSerializer(serializers.ModelSerializer):
-    image = Base64ImageField(read_only=True)
+    image = RecipeImageField(variant="thumbnail")
     name = serializers.ReadOnlyField()
     cooking_time = serializers.ReadOnlyField()
 
@@ -131,6 +189,8 @@ class UserSubscriptionsSerializer(serializers.ModelSerializer):
         )
 
     def get_is_subscribed(self, obj):
+        if hasattr(obj, "is_subscribed"):
+            return obj.is_subscribed
         return (
             self.context.get("request").user.is_authenticated
             and Subscribe.objects.filter(
@@ -139,14 +199,17 @@ class UserSubscriptionsSerializer(serializers.ModelSerializer):
         )
 
     def get_recipes_count(self, obj):
-        return obj.recipes.count()
+        return obj.recipes_count
 
     def get_recipes(self, obj):
-        request = self.context.get("request")
-        limit = request.GET.get("recipes_limit")
-        recipes = obj.recipes.all()
-        if limit:
-            recipes = recipes[: int(limit)]
+        if hasattr(obj, "limited_recipes"):
+            recipes = obj.limited_recipes
+        else:
+            request = self.context.get("request")
+            limit = request.GET.get("recipes_limit")
+            recipes = obj.recipes.all()
+            if limit:
+                recipes = recipes[: int(limit)]
         serializer = RecipeAuthorShortSerializer(
             recipes, many=True, read_only=True
         )
@@ -204,54 +267,95 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         )
 
     def validate_ingredients(self, value):
-        ingredients_list = []
-        for ingredient in value:
-            if ingredient["id"] in ingredients_list:
-                raise serializers.ValidationError(
-                    "Ингредиенты не должны повторяеться"
-                )
-            ingredients_list.append(ingredient["id"])
-            return value
+        if not value:
+            raise serializers.ValidationError(
+                "Нужно указать хотя бы один ингредиент"
+            )
+        ingredients_list = [ingredient["id"] for ingredient in value]
+        if len(set(ingredients_list)) != len(ingredients_list):
+            raise serializers.ValidationError(
+                "Ингредиенты не должны повторяеться"
+            )
+        existing = set(
+            Ingredient.objects.filter(id__in=ingredients_list).values_list(
+                "id", flat=True
+            )
+        )
+        missing = [id for id in ingredients_list if id not in existing]
+        if missing:
+            raise serializers.ValidationError(
+                f"Ингредиенты не найдены: {missing}"
+            )
+        return value
 
     def validate_tags(self, value):
-        tags_list = []
-        for tag in value:
-            if tag in tags_list:
-                raise serializers.ValidationError(
-                    "Теги не должны повторяеться"
-                )
-            tags_list.append(tag)
-            return value
+        if not value:
+            raise serializers.ValidationError("Нужно указать хотя бы один тег")
+        if len(set(value)) != len(value):
+            raise serializers.ValidationError("Теги не должны повторяеться")
+        return value
 
     def add_ingredients(self, recipe, ingredients):
-        for ingredient in ingredients:
-            IngredientRecipe.objects.create(
+        IngredientRecipe.objects.bulk_create(
+            IngredientRecipe(
                 ingredient_id=ingredient.get("id"),
                 amount=ingredient.get("amount"),
                 recipe=recipe,
             )
+            for ingredient in ingredients
+        )
         return ingredients
 
+    def update_ingredients(self, recipe, ingredients):
+        """
+        Syncs recipe ingredients touching only the rows that changed.
+        """
+        amounts = {
+            ingredient["id"]: ingredient["amount"]
+            for ingredient in ingredients
+        }
+        to_delete, to_update = [], []
+        for item in recipe.ingredients_recipe.all():
+            amount = amounts.pop(item.ingredient_id, None)
+            if amount is None:
+                to_delete.append(item.id)
+            elif amount != item.amount:
+                item.amount = amount
+                to_update.append(item)
+        if to_delete:
+            IngredientRecipe.objects.filter(id__in=to_delete).delete()
+        if to_update:
+            IngredientRecipe.objects.bulk_update(to_update, ("amount",))
+        self.add_ingredients(
+            recipe,
+            [{"id": id, "amount": amount} for id, amount in amounts.items()],
+        )
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop("ingredients")
         tags = validated_data.pop("tags")
         recipe = Recipe.objects.create(**validated_data)
         recipe.tags.set(tags)
         self.add_ingredients(recipe, ingredients)
-        recipe.save()
+        flush_rebuild()
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        ingredients = validated_data.pop("ingredients")
-        tags = validated_data.pop("tags")
+        ingredients = validated_data.pop("ingredients", None)
+        tags = validated_data.pop("tags", None)
         super().update(instance, validated_data)
-        instance.ingredients.clear()
-        instance.tags.set(tags)
-        self.add_ingredients(instance, ingredients)
-        instance.save()
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            self.update_ingredients(instance, ingredients)
+        flush_rebuild()
         return instance
 
     def get_is_favorited(self, obj):
+        if "recipe_state" in self.context:
+            return obj.id in self.context["recipe_state"].favorited
         return (
             self.context.get("request").user.is_authenticated
             and Favorite.objects.filter(
@@ -260,6 +364,8 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         )
 
     def get_is_in_shopping_cart(self, obj):
+        if "recipe_state" in self.context:
+            return obj.id in self.context["recipe_state"].in_shopping_cart
         return (
             self.context.get("request").user.is_authenticated
             and ShoppingCart.objects.filter(
@@ -271,16 +377,19 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 class RecipeReadSerializer(RecipeCreateSerializer):
     author = UsersSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField()
-    image = Base64ImageField(read_only=True)
+    image = RecipeImageField()
     tags = TagSerializer(read_only=True, many=True)
 
     def get_ingredients(self, obj):
-        return obj.ingredients.values(
-            "id",
-            "name",
-            "measurement_unit",
-            amount=F("ingredients_recipe__amount"),
-        )
+        return [
+            {
+                "id": item.ingredient.id,
+                "name": item.ingredient.name,
+                "measurement_unit": item.ingredient.measurement_unit,
+                "amount": item.amount,
+            }
+            for item in obj.ingredients_recipe.all()
+        ]
 
     class Meta:
         model = Recipe
@@ -298,19 +407,102 @@ class RecipeReadSerializer(RecipeCreateSerializer):
         )
 
 
-class FavoriteSerializer(serializers.Serializer):
-    class Meta:
-        model = Favorite
-        fields = ("user", "recipe")
+class RecipeDocumentListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        recipes = list(data)
+        missing = [recipe.id for recipe in recipes if not recipe.document]
+        if missing:
+            self.child.documents = build_documents(missing)
+        return [self.child.to_representation(recipe) for recipe in recipes]
+
 
+class RecipeDocumentSerializer(serializers.BaseSerializer):
+    """
+    RecipeReadSerializer output rendered from Recipe.document: per request
+    only the image URL and the flags of the current user are added.
+    Recipes without a document yet are built on the fly. Expects
+    with_documents() on the queryset and recipe_state in the context.
+    """
 
-class ShopingCartSerializer(serializers.Serializer):
     class Meta:
-        model = ShoppingCart
-        fields = ("user", "recipe")
+        list_serializer_class = RecipeDocumentListSerializer
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.documents = {}
+        self.image = RecipeImageField()
+        self.image.bind("image", self)
+
+    def to_representation(self, recipe):
+        document = recipe.document or self.documents.get(recipe.id)
+        if not document:
+            document = build_documents([recipe.id])[recipe.id]
+        state = self.context["recipe_state"]
+        author = {field: document["author"][field] for field in AUTHOR_FIELDS}
+        author["is_subscribed"] = recipe.is_author_subscribed
+        return {
+            "id": recipe.id,
+            "tags": [
+                {field: tag[field] for field in TAG_FIELDS}
+                for tag in document["tags"]
+            ],
+            "author": author,
+            "ingredients": [
+                {field: item[field] for field in INGREDIENT_FIELDS}
+                for item in document["ingredients"]
+            ],
+            "is_favorited": recipe.id in state.favorited,
+            "is_in_shopping_cart": recipe.id in state.in_shopping_cart,
+            "name": recipe.name,
+            "image": self.image.to_representation(recipe),
+            "text": recipe.text,
+            "cooking_time": recipe.cooking_time,
+        }
 
 
 class GetShoppingCartSerializer(serializers.ModelSerializer):
     class Meta:
         model = ShoppingCart
         fields = ("recipe",)
+
+
+class ShoppingListExportSerializer(serializers.ModelSerializer):
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = ShoppingListExport
+        fields = ("id", "format", "status", "error", "created", "download")
+        read_only_fields = ("status", "error", "created")
+
+    def get_download(self, obj):
+        if obj.status != ShoppingListExport.DONE:
+            return None
+        return self.context["request"].build_absolute_uri(
+            reverse("shopping-list-export-download", args=(obj.id,))
+        )
+
+
+class BatchOperationSerializer(serializers.Serializer):
+    type = serializers.ChoiceField(
+        choices=("favorite", "shopping_cart", "subscribe")
+    )
+    action = serializers.ChoiceField(choices=("add", "remove"))
+    id = serializers.IntegerField(min_value=1)
+
+
+class BatchSerializer(serializers.Serializer):
+    operations = BatchOperationSerializer(many=True, allow_empty=False)
+
+    def validate_operations(self, value):
+        if len(value) > settings.BATCH_MAX_OPERATIONS:
+            raise serializers.ValidationError(
+                "Не больше {} операций за запрос".format(
+                    settings.BATCH_MAX_OPERATIONS
+                )
+            )
+        targets = [(operation["type"], operation["id"]) for operation in value]
+        if len(set(targets)) != len(targets):
+            raise serializers.ValidationError(
+                "Операции с одним объектом не должны повторяться"
+            )
+        return value
@@ -0,0 +1,305 @@
+import csv
+import hashlib
+import io
+import json
+import os
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.files.base import ContentFile
+from django.db import close_old_connections, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen.canvas import Canvas
+
+from api.metrics import PDF_PAGES
+from recipes.models import ShoppingCart, ShoppingListExport
+
+path = "data"
+FONT_NAME = "Arial"
+PAGE_SIZE = (650, 500)
+ACTIVE_STATUSES = (ShoppingListExport.PENDING, ShoppingListExport.RUNNING)
+STALE_ERROR = "Выгрузка прервана, запустите ее заново"
+
+
+@lru_cache(maxsize=None)
+def register_font():
+    """
+    Parses the TTF file once per process.
+    """
+    pdfmetrics.registerFont(
+        TTFont(FONT_NAME, os.path.join(path, "Arial.ttf"))
+    )
+    return FONT_NAME
+
+
+def shopping_list_queryset(user):
+    """
+    Ingredients of all recipes in the user's shopping cart summed up
+    as (name, measurement_unit, total) rows.
+    """
+    return (
+        ShoppingCart.objects.filter(user=user.id)
+        .values_list(
+            "recipe__ingredients__name",
+            "recipe__ingredients__measurement_unit",
+        )
+        .distinct()
+        .annotate(total=Sum("recipe__ingredients_recipe__amount"))
+    )
+
+
+def get_ingredients(user):
+    return list(shopping_list_queryset(user))
+
+
+def render_pdf(ingredients):
+    font = register_font()
+    buffer = io.BytesIO()
+    s = Canvas(buffer)
+    s.setFont(font, 35)
+    s.setPageSize(PAGE_SIZE)
+    start_y = 400
+    start_x = 10
+    s.drawString(10, 450, "Ваш список ингредиентов:")
+    s.setFont(font, 20)
+    page = 1
+    for ing in ingredients:
+        start_y -= 50
+        s.drawString(
+            start_x,
+            start_y,
+            "{}, мера - {}, количество - {}.".format(*ing),
+        )
+        if start_y == 50:
+            page += 1
+            s.showPage()
+            s.setFont(font, 35)
+            s.drawString(10, 450, f"Страница - {page}")
+            s.setFont(font, 20)
+            start_y = 400
+    s.save()
+    PDF_PAGES.inc(page)
+    return buffer.getvalue()
+
+
+def cache_key(ingredients):
+    digest = hashlib.sha256(repr(ingredients).encode("utf-8")).hexdigest()
+    return f"shopping_list:pdf:{digest}"
+
+
+def get_pdf(ingredients):
+    """
+    Returns the rendered PDF, reusing the cached one
+    when the aggregated ingredient rows did not change.
+    PDFs have their own small cache, so they can not evict the token
+    and state keys of the default one.
+    """
+    pdf_cache = caches[settings.SHOPPING_LIST_CACHE_ALIAS]
+    key = cache_key(ingredients)
+    pdf = pdf_cache.get(key)
+    if pdf is None:
+        pdf = render_pdf(ingredients)
+        pdf_cache.set(key, pdf, settings.SHOPPING_LIST_CACHE_TIMEOUT)
+    return pdf
+
+
+class Echo:
+    """
+    File-like object whose write() returns the value instead of storing it,
+    so csv.writer can be used to produce a stream.
+    """
+
+    def write(self, value):
+        return value
+
+
+class Exporter:
+    format = None
+    content_type = None
+    # Whether export() produces the file piece by piece and can be sent
+    # with a StreamingHttpResponse.
+    streaming = True
+
+    def export(self, ingredients):
+        """
+        Returns an iterable of bytes chunks.
+        """
+        raise NotImplementedError
+
+    def render(self, ingredients):
+        """
+        Returns the whole file.
+        """
+        return b"".join(self.export(ingredients))
+
+    @property
+    def filename(self):
+        return f"Shopping_list.{self.format}"
+
+
+EXPORTERS = {}
+
+
+def register_exporter(exporter_class):
+    EXPORTERS[exporter_class.format] = exporter_class()
+    return exporter_class
+
+
+@register_exporter
+class PDFExporter(Exporter):
+    format = "pdf"
+    content_type = "application/pdf"
+
+    # ReportLab writes the document only on save().
+    streaming = False
+
+    def render(self, ingredients):
+        return get_pdf(ingredients)
+
+
+@register_exporter
+class TextExporter(Exporter):
+    format = "txt"
+    content_type = "text/plain; charset=utf-8"
+
+    def export(self, ingredients):
+        yield "Ваш список ингредиентов:\n".encode("utf-8")
+        for ing in ingredients:
+            yield "{}, мера - {}, количество - {}.\n".format(*ing).encode(
+                "utf-8"
+            )
+
+
+@register_exporter
+class CSVExporter(Exporter):
+    format = "csv"
+    content_type = "text/csv; charset=utf-8"
+
+    def export(self, ingredients):
+        writer = csv.writer(Echo())
+        yield writer.writerow(("name", "measurement_unit", "amount")).encode(
+            "utf-8"
+        )
+        for ing in ingredients:
+            yield writer.writerow(ing).encode("utf-8")
+
+
+@register_exporter
+class JSONExporter(Exporter):
+    format = "json"
+    content_type = "application/json"
+
+    def export(self, ingredients):
+        yield b"["
+        for number, (name, measurement_unit, amount) in enumerate(
+            ingredients
+        ):
+            item = json.dumps(
+                {
+                    "name": name,
+                    "measurement_unit": measurement_unit,
+                    "amount": amount,
+                },
+                ensure_ascii=False,
+            )
+            yield ((", " if number else "") + item).encode("utf-8")
+        yield b"]"
+
+
+executor = ThreadPoolExecutor(
+    max_workers=settings.SHOPPING_LIST_EXPORT_WORKERS,
+    thread_name_prefix="shopping-list-export",
+)
+
+
+def run_export(export_id):
+    """
+    Renders a queued ShoppingListExport into MEDIA_ROOT.
+    Runs on the executor, outside of the request thread.
+    """
+    close_old_connections()
+    try:
+        exports = ShoppingListExport.objects.filter(id=export_id)
+        # A job failed as stale in the meantime is not started.
+        if not exports.filter(status=ShoppingListExport.PENDING).update(
+            status=ShoppingListExport.RUNNING
+        ):
+            return
+        export = exports.select_related("user").get()
+        try:
+            exporter = EXPORTERS[export.format]
+            content = exporter.render(get_ingredients(export.user))
+            export.file.save(
+                f"{uuid.uuid4().hex}.{export.format}",
+                ContentFile(content),
+                save=False,
+            )
+            export.status = ShoppingListExport.DONE
+        except Exception as error:
+            export.status = ShoppingListExport.FAILED
+            export.error = str(error)
+        if not exports.filter(status=ShoppingListExport.RUNNING).update(
+            status=export.status, file=export.file.name, error=export.error
+        ) and export.file:
+            export.file.delete(save=False)
+    finally:
+        close_old_connections()
+
+
+def enqueue_export(export):
+    transaction.on_commit(lambda: executor.submit(run_export, export.id))
+
+
+def stale_before():
+    return timezone.now() - timedelta(
+        seconds=settings.SHOPPING_LIST_EXPORT_TIMEOUT
+    )
+
+
+def fail_stale(export):
+    """
+    Jobs only live on the executor of the process that queued them, so
+    after a restart they would stay pending forever.
+    """
+    if (
+        export.status in ACTIVE_STATUSES
+        and export.created < stale_before()
+    ):
+        export.status = ShoppingListExport.FAILED
+        export.error = STALE_ERROR
+        ShoppingListExport.objects.filter(
+            id=export.id, status__in=ACTIVE_STATUSES
+        ).update(status=export.status, error=export.error)
+    return export
+
+
+def expire_exports(exports):
+    """
+    Fails the stale jobs among exports and deletes the ones older than
+    SHOPPING_LIST_EXPORT_TTL together with their files.
+    Returns the numbers of failed and deleted exports.
+    """
+    failed = exports.filter(
+        status__in=ACTIVE_STATUSES, created__lt=stale_before()
+    ).update(status=ShoppingListExport.FAILED, error=STALE_ERROR)
+    expired = list(
+        exports.filter(
+            created__lt=timezone.now()
+            - timedelta(seconds=settings.SHOPPING_LIST_EXPORT_TTL)
+        )
+    )
+    for export in expired:
+        if export.file:
+            export.file.delete(save=False)
+    if expired:
+        ShoppingListExport.objects.filter(
+            id__in=[export.id for export in expired]
+        ).delete()
+    return failed, len(expired)
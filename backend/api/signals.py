@@ -0,0 +1,144 @@
+from django.contrib.auth.signals import user_logged_out
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from api.authentication import invalidate_tokens
+from api.cache import bump_version, invalidate_responses
+from api.documents import AUTHOR_FIELDS, schedule_rebuild
+from api.images import enqueue_recipe_image, variants_outdated
+from api.ingredient_index import ingredient_index
+from api.recipe_state import invalidate_state
+from recipes.models import (Favorite, Ingredient, IngredientRecipe, Recipe,
+                            ShoppingCart, Tag)
+from recipes.signals import ingredients_changed
+from users.models import User
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(ingredients_changed, sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    """
+    After commit, so a request can not load the old rows into the index
+    or cache them under the new generation.
+    """
+
+    def invalidate():
+        ingredient_index.invalidate()
+        bump_version("ingredients")
+
+    transaction.on_commit(invalidate)
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    transaction.on_commit(lambda: bump_version("tags"))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+def invalidate_recipe_state(sender, instance, **kwargs):
+    invalidate_state(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=IngredientRecipe)
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_recipe_responses(sender, update_fields=None, **kwargs):
+    """
+    Tags and ingredient rows of a recipe are only changed together with
+    the recipe itself, so its post_save covers them. Listening to
+    m2m_changed or IngredientRecipe post_delete would disable Django's
+    fast add/delete paths and cost an extra SELECT per write.
+    """
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+    invalidate_responses("recipes")
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_save, sender=IngredientRecipe)
+def rebuild_recipe_document(sender, instance, **kwargs):
+    schedule_rebuild([getattr(instance, "recipe_id", instance.id)])
+
+
+@receiver(post_save, sender=Recipe)
+def rebuild_image_variants(sender, instance, update_fields=None, **kwargs):
+    """
+    Covers images changed in the admin as well as through the API.
+    """
+    if update_fields is not None and "image" not in update_fields:
+        return
+    if variants_outdated(instance):
+        enqueue_recipe_image(instance)
+
+
+@receiver(post_save, sender=Tag)
+def rebuild_tag_documents(sender, instance, created, **kwargs):
+    if not created:
+        schedule_rebuild(tags=instance.id)
+
+
+@receiver(post_save, sender=Ingredient)
+def rebuild_ingredient_documents(sender, instance, created, **kwargs):
+    if not created:
+        schedule_rebuild(ingredients=instance.id)
+
+
+@receiver(pre_delete, sender=Tag)
+@receiver(pre_delete, sender=Ingredient)
+def rebuild_deleted_documents(sender, instance, **kwargs):
+    """
+    The links are gone after the delete, so the recipes are looked up now.
+    """
+    lookup = "tags" if sender is Tag else "ingredients"
+    schedule_rebuild(
+        Recipe.objects.filter(**{lookup: instance.id}).values_list(
+            "id", flat=True
+        )
+    )
+
+
+@receiver(post_save, sender=User)
+def rebuild_author_documents(
+    sender, instance, created, update_fields=None, **kwargs
+):
+    if created:
+        return
+    if update_fields is not None and not set(update_fields) & set(
+        AUTHOR_FIELDS
+    ):
+        return
+    schedule_rebuild(author_id=instance.id)
+
+
+@receiver(user_logged_out)
+def invalidate_logged_out_tokens(sender, user=None, **kwargs):
+    if user is not None:
+        invalidate_tokens(user.id)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_user_tokens(
+    sender, instance, created=False, update_fields=None, **kwargs
+):
+    """
+    Deactivation and password changes reach cached tokens through here,
+    any other change refreshes the cached user as well.
+    """
+    if created:
+        return
+    if update_fields is not None and set(update_fields) == {"last_login"}:
+        return
+    invalidate_tokens(instance.id)
@@ -0,0 +1,207 @@
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import Http404
+from django.shortcuts import get_object_or_404
+from rest_framework import status
+
+from api.recipe_state import invalidate_state
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscribe, User
+
+
+class Toggle:
+    """
+    A user relation written with single statements:
+    INSERT ... ON CONFLICT DO NOTHING and DELETE ... RETURNING.
+    They bypass the model signals, so the counter and the cached recipe
+    state the signals maintain are updated here.
+    """
+
+    def __init__(self, model, field_name, counter, recipe_state=False):
+        self.model = model
+        self.field = model._meta.get_field(field_name)
+        self.target = self.field.related_model
+        self.counter = counter
+        self.recipe_state = recipe_state
+
+    def sql_names(self):
+        quote = connection.ops.quote_name
+        return {
+            "table": quote(self.model._meta.db_table),
+            "user": quote(self.model._meta.get_field("user").column),
+            "field": quote(self.field.column),
+            "target_table": quote(self.target._meta.db_table),
+            "target_pk": quote(self.target._meta.pk.column),
+        }
+
+    def other_columns(self):
+        """
+        Columns besides the two keys with the values a new model
+        instance would save: defaults and auto_now_add timestamps.
+        """
+        instance = self.model()
+        columns, values = [], []
+        for field in self.model._meta.concrete_fields:
+            if field.primary_key or field.name in ("user", self.field.name):
+                continue
+            columns.append(connection.ops.quote_name(field.column))
+            values.append(
+                field.get_db_prep_save(
+                    field.pre_save(instance, True), connection
+                )
+            )
+        return columns, values
+
+    def execute(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [row[0] for row in cursor.fetchall()]
+
+    @transaction.atomic(savepoint=False)
+    def add(self, user_id, target_ids):
+        """
+        Links the existing targets among target_ids to the user and
+        returns the ids that were not linked before.
+        """
+        if not target_ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(target_ids))
+        columns, values = self.other_columns()
+        added = self.execute(
+            "INSERT INTO {table} ({user}, {field}{columns}) "
+            "SELECT %s, {target_pk}{values} FROM {target_table} "
+            "WHERE {target_pk} IN ({placeholders}) "
+            "ON CONFLICT DO NOTHING RETURNING {field}".format(
+                columns="".join(f", {column}" for column in columns),
+                values=", %s" * len(values),
+                placeholders=placeholders,
+                **self.sql_names(),
+            ),
+            (user_id, *values, *target_ids),
+        )
+        self.changed(user_id, added, 1)
+        return added
+
+    @transaction.atomic(savepoint=False)
+    def remove(self, user_id, target_ids):
+        """
+        Unlinks target_ids from the user and returns the removed ids.
+        """
+        if not target_ids:
+            return []
+        placeholders = ", ".join(["%s"] * len(target_ids))
+        removed = self.execute(
+            "DELETE FROM {table} "
+            "WHERE {user} = %s AND {field} IN ({placeholders}) "
+            "RETURNING {field}".format(
+                placeholders=placeholders, **self.sql_names()
+            ),
+            (user_id, *target_ids),
+        )
+        self.changed(user_id, removed, -1)
+        return removed
+
+    def changed(self, user_id, target_ids, delta):
+        if not target_ids:
+            return
+        queryset = self.target.objects.filter(pk__in=target_ids)
+        if delta < 0:
+            queryset = queryset.filter(**{f"{self.counter}__gte": -delta})
+        queryset.update(**{self.counter: F(self.counter) + delta})
+        if self.recipe_state:
+            invalidate_state(user_id)
+
+
+favorites = Toggle(Favorite, "recipe", "favorites_count", recipe_state=True)
+shopping_cart = Toggle(
+    ShoppingCart, "recipe", "shopping_cart_count", recipe_state=True
+)
+subscriptions = Toggle(Subscribe, "author", "followers_count")
+
+TOGGLES = {
+    "favorite": favorites,
+    "shopping_cart": shopping_cart,
+    "subscribe": subscriptions,
+}
+ACTIONS = {"POST": "add", "DELETE": "remove"}
+# (status, detail) when the relation changed and when it was already so,
+# shared by the single toggle views and the batch endpoint.
+OUTCOMES = {
+    ("favorite", "add"): (
+        (status.HTTP_201_CREATED, "Успешное добавление рецепта в избранное"),
+        (status.HTTP_400_BAD_REQUEST, "Вы уже добавили этот рецепт"),
+    ),
+    ("favorite", "remove"): (
+        (
+            status.HTTP_204_NO_CONTENT,
+            "Успешное удаление рецепта из избранного",
+        ),
+        (status.HTTP_400_BAD_REQUEST, "Вы уже удалили этот рецепт"),
+    ),
+    ("shopping_cart", "add"): (
+        (
+            status.HTTP_201_CREATED,
+            "Успешное добавление рецепта в список покупок",
+        ),
+        (status.HTTP_400_BAD_REQUEST, "Вы уже добавили этот рецепт"),
+    ),
+    ("shopping_cart", "remove"): (
+        (
+            status.HTTP_204_NO_CONTENT,
+            "Успешное удаление рецепта из списка покупок",
+        ),
+        (status.HTTP_400_BAD_REQUEST, "Вы уже удалили этот рецепт"),
+    ),
+    ("subscribe", "add"): (
+        (status.HTTP_201_CREATED, "Успешная подписка"),
+        (
+            status.HTTP_400_BAD_REQUEST,
+            "Вы уже подписаны на данного пользователя",
+        ),
+    ),
+    ("subscribe", "remove"): (
+        (status.HTTP_204_NO_CONTENT, "Успешная отписка"),
+        (
+            status.HTTP_404_NOT_FOUND,
+            "Вы не подписаны на данного пользователя",
+        ),
+    ),
+}
+SELF_SUBSCRIBE = "Нельзя подписаться на самого себя"
+
+
+def toggle(user, method, name, model, target_id):
+    """
+    (data, status) of a single toggle request. One INSERT or DELETE;
+    the target is looked up only to tell a missing one from a repeated
+    request.
+    """
+    action = ACTIONS.get(method)
+    if action is None:
+        return {"detail": "-__-"}, status.HTTP_200_OK
+    changed, unchanged = OUTCOMES[name, action]
+    if getattr(TOGGLES[name], action)(user.id, [target_id]):
+        code, detail = changed
+        return {"Success" if action == "add" else "detail": detail}, code
+    code, detail = unchanged
+    if code == status.HTTP_404_NOT_FOUND:
+        raise Http404(detail)
+    get_object_or_404(model, id=target_id)
+    return detail, code
+
+
+def toggle_recipe(user, method, name, recipe_id):
+    """
+    A favorite or shopping cart request, shared by the sync and async
+    views.
+    """
+    return toggle(user, method, name, Recipe, recipe_id)
+
+
+def toggle_subscription(user, method, author_id):
+    """
+    A subscribe request.
+    """
+    if method == "POST" and author_id == user.id:
+        return SELF_SUBSCRIBE, status.HTTP_400_BAD_REQUEST
+    return toggle(user, method, "subscribe", User, author_id)
@@ -2,8 +2,11 @@ from django.conf import settings
 from django.conf.urls.static import static
 from django.urls import include, path
 
+from api import async_views
 from api.custom_routers import PutMethodNotAllow
-from api.views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from api.metrics import metrics
+from api.views import (BatchView, IngredientViewSet, RecipeViewSet,
+                       ShoppingListExportViewSet, TagViewSet, UserViewSet)
 
 router_no_put_v1 = PutMethodNotAllow()
 router_no_put_v1.register("users", UserViewSet, basename="user")
@@ -12,12 +15,48 @@ router_no_put_v1.register("tags", TagViewSet, basename="tag")
 router_no_put_v1.register(
     "ingredients", IngredientViewSet, basename="ingredient"
 )
+router_no_put_v1.register(
+    "shopping_list_exports",
+    ShoppingListExportViewSet,
+    basename="shopping-list-export",
+)
 
 urlpatterns = [
     path("", include(router_no_put_v1.urls)),
     path("auth/", include("djoser.urls.authtoken")),
+    path("batch/", BatchView.as_view(), name="batch"),
+    path("metrics", metrics, name="metrics"),
 ]
 
+if settings.ASYNC_VIEWS:
+    # Ahead of the router so the same URLs and names resolve to the
+    # async views under ASGI.
+    urlpatterns = [
+        path(
+            "recipes/download_shopping_cart/",
+            async_views.download_shopping_cart,
+            name="recipe-download-shopping-cart",
+        ),
+        path(
+            "recipes/<int:pk>/favorite/",
+            async_views.favorite,
+            name="recipe-favorite",
+        ),
+        path(
+            "recipes/<int:pk>/shopping_cart/",
+            async_views.shopping_cart,
+            name="recipe-shopping-cart",
+        ),
+        path(
+            "users/<int:pk>/subscribe/",
+            async_views.subscribe,
+            name="user-subscribe",
+        ),
+        path(
+            "ingredients/", async_views.ingredients, name="ingredient-list"
+        ),
+    ] + urlpatterns
+
 if settings.DEBUG:
     urlpatterns += static(
         settings.MEDIA_URL, document_root=settings.MEDIA_ROOT
@@ -1,37 +1,55 @@
-import io
-import os
+from collections import defaultdict
 
-from django.db.models import Sum
-from django.http import FileResponse
-from django.shortcuts import get_object_or_404
+from django.db import transaction
+from django.db.models import BooleanField, CharField, F, Value
+from django.http import FileResponse, HttpResponse, StreamingHttpResponse
 from django_filters.rest_framework import DjangoFilterBackend
-from reportlab.pdfbase import pdfmetrics
-from reportlab.pdfbase.ttfonts import TTFont
-from reportlab.pdfgen.canvas import Canvas
-from rest_framework import status, viewsets
+from rest_framework import mixins, status, viewsets
 from rest_framework.decorators import action
-from rest_framework.filters import SearchFilter
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework.response import Response
+from rest_framework.views import APIView
 from rest_framework.viewsets import ModelViewSet
 
+from api import toggles
+from api.cache import AnonymousCacheMixin, ReferenceCacheMixin
+from api.fast_serializers import (SUBSCRIPTION_PLAN, TAG_PLAN, USER_PLAN,
+                                  render_subscriptions, subscribed_to)
 from api.filters import RecipeFilter
+from api.ingredient_index import ingredient_index
 from api.pagination import CustomPaginator
 from api.permissions import IsAdminOrReadOnly, IsAuthorOrReadOnlyPermission
-from api.serializers import (ChangePasswordSerializer, FavoriteSerializer,
-                            IngredientSerializer, RecipeCreateSerializer,
-                            RecipeReadSerializer, ShopingCartSerializer,
-                            TagSerializer, UsersSerializer,
-                            UsersSubscribeSerializer,
-                            UserSubscriptionsSerializer)
-from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
-from users.models import Subscribe, User
+from api.recipe_state import get_recipe_state
+from api.serializers import (BatchSerializer, ChangePasswordSerializer,
+                             IngredientSerializer, RecipeCreateSerializer,
+                             RecipeDocumentSerializer, RecipeReadSerializer,
+                             ShoppingListExportSerializer, TagSerializer,
+                             UsersSerializer)
+from api.shopping_list import (EXPORTERS, enqueue_export, expire_exports,
+                               fail_stale, get_ingredients)
+from recipes.models import Ingredient, Recipe, ShoppingListExport, Tag
+from users.models import User
 
 
 class UserViewSet(ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UsersSerializer
     pagination_class = CustomPaginator
+    cursor_ordering = "-id"
+    lookup_value_regex = r"\d+"
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ("list", "retrieve"):
+            queryset = queryset.annotate(
+                is_subscribed=subscribed_to(self.request.user)
+            )
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset.values(*USER_PLAN.columns))
+        return self.get_paginated_response(USER_PLAN.render_many(page))
 
     def get_permissions(self):
         """
@@ -82,7 +100,7 @@ class UserViewSet(ModelViewSet):
         serializer = self.get_serializer(data=request.data)
         serializer.is_valid(raise_exception=True)
         request.user.set_password(serializer.validated_data["new_password"])
-        request.user.save()
+        request.user.save(update_fields=("password",))
         return Response("new password set", status=status.HTTP_204_NO_CONTENT)
 
     @action(
@@ -91,42 +109,10 @@ class UserViewSet(ModelViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def subscribe(self, request, **kwargs):
-        author = get_object_or_404(User, id=kwargs["pk"])
-        if request.method == "POST":
-            if Subscribe.objects.filter(
-                user=request.user, author=author
-            ).exists():
-                return Response(
-                    "Вы уже подписаны на данного пользователя",
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            if request.user == author:
-                return Response(
-                    "Нельзя подписаться на самого себя",
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            serializer = UsersSubscribeSerializer(
-                author, data=request.data, context={"request": request}
-            )
-            serializer.is_valid(raise_exception=True)
-            Subscribe.objects.create(user=request.user, author=author)
-            headers = self.get_success_headers(serializer.data)
-            return Response(
-                {"Success": "Успешная подписка"},
-                status=status.HTTP_201_CREATED,
-                headers=headers,
-            )
-
-        if request.method == "DELETE":
-            get_object_or_404(
-                Subscribe, user=request.user, author=author
-            ).delete()
-            return Response(
-                {"detail": "Успешная отписка"},
-                status=status.HTTP_204_NO_CONTENT,
-            )
         return Response(
-            {"detail": "-__-"},
+            *toggles.toggle_subscription(
+                request.user, request.method, int(kwargs["pk"])
+            )
         )
 
     @action(
@@ -136,92 +122,114 @@ class UserViewSet(ModelViewSet):
         pagination_class=CustomPaginator,
         permission_classes=(IsAuthenticated,),
         serializer_class=UsersSerializer,
+        cursor_ordering="-subscription_id",
     )
     def subscriptions(self, request):
-        queryset = User.objects.filter(following__user=request.user)
-        page = self.paginate_queryset(queryset)
-        serializer = UserSubscriptionsSerializer(
-            page, many=True, context={"request": request}
+        queryset = User.objects.filter(following__user=request.user).annotate(
+            subscription_id=F("following__id"),
+            is_subscribed=Value(True, output_field=BooleanField()),
+        )
+        page = self.paginate_queryset(
+            queryset.values(*SUBSCRIPTION_PLAN.columns, "subscription_id")
+        )
+        author_ids = [author["id"] for author in page]
+        limit = request.query_params.get("recipes_limit", "")
+        recipes = Recipe.objects.filter(author_id__in=author_ids)
+        if limit.isdigit():
+            recipes = recipes.latest_per_author(author_ids, int(limit))
+        return self.get_paginated_response(
+            render_subscriptions(page, recipes)
         )
-        return self.get_paginated_response(serializer.data)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+def search_ingredients(request):
+    name = request.GET.get("name")
+    if name:
+        return Response(ingredient_index.search(name))
+    return Response(ingredient_index.all())
+
+
+class IngredientViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
+    cache_namespace = "ingredients"
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     permission_classes = (AllowAny,)
-    filter_backends = (SearchFilter, DjangoFilterBackend)
-    search_fields = ("^name",)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, search_ingredients)
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+
+class TagViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
+    cache_namespace = "tags"
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     permission_classes = (AllowAny,)
     pagination_class = None
 
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(request, self.render_list)
+
+    def render_list(self, request):
+        return Response(
+            TAG_PLAN.render_many(
+                self.get_queryset().values(*TAG_PLAN.columns)
+            )
+        )
 
-class RecipeViewSet(viewsets.ModelViewSet):
+
+class RecipeViewSet(AnonymousCacheMixin, viewsets.ModelViewSet):
+    cache_namespace = "recipes"
     queryset = Recipe.objects.all()
+    lookup_value_regex = r"\d+"
     permission_classes = (IsAuthorOrReadOnlyPermission,)
     pagination_class = CustomPaginator
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
 
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        if self.action in ("list", "retrieve"):
+            queryset = queryset.with_documents(self.request.user)
+        return queryset
+
     def get_serializer_class(self):
+        if self.action in ("list", "retrieve"):
+            return RecipeDocumentSerializer
         if self.request.method == "GET":
             return RecipeReadSerializer
         return RecipeCreateSerializer
 
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        if self.action in ("list", "retrieve"):
+            context["recipe_state"] = get_recipe_state(self.request)
+        if self.action == "list":
+            context["image_variant"] = "thumbnail"
+        return context
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
+    def perform_content_negotiation(self, request, force=False):
+        """
+        The ?format= parameter of download_shopping_cart selects an exporter,
+        not a renderer, so fall back to the default renderer for errors.
+        """
+        if self.action == "download_shopping_cart":
+            force = True
+        return super().perform_content_negotiation(request, force)
+
     @action(
         detail=True,
         methods=["post", "delete"],
         permission_classes=(IsAuthenticated,),
     )
     def favorite(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs["pk"])
-
-        if request.method == "POST":
-            if Favorite.objects.filter(
-                user=request.user, recipe=recipe
-            ).exists():
-                return Response(
-                    "Вы уже добавили этот рецепт",
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            serializer = FavoriteSerializer(
-                recipe, data=request.data, context={"request": request}
-            )
-            serializer.is_valid(raise_exception=True)
-            Favorite.objects.create(user=request.user, recipe=recipe)
-            headers = self.get_success_headers(serializer.data)
-            return Response(
-                {"Success": "Успешное добавление рецепта в избранное"},
-                status=status.HTTP_201_CREATED,
-                headers=headers,
-            )
-
-        if request.method == "DELETE":
-            if not Favorite.objects.filter(
-                user=request.user, recipe=recipe
-            ).exists():
-                return Response(
-                    "Вы уже удалили этот рецепт",
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            get_object_or_404(
-                Favorite, user=request.user, recipe=recipe
-            ).delete()
-            return Response(
-                {"detail": "Успешное удаление рецепта из избранного"},
-                status=status.HTTP_204_NO_CONTENT,
-            )
         return Response(
-            {"detail": "-__-"},
+            *toggles.toggle_recipe(
+                request.user, request.method, "favorite", int(kwargs["pk"])
+            )
         )
 
     @action(
@@ -230,46 +238,13 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def shopping_cart(self, request, **kwargs):
-        recipe = get_object_or_404(Recipe, id=kwargs["pk"])
-
-        if request.method == "POST":
-            if ShoppingCart.objects.filter(
-                user=request.user, recipe=recipe
-            ).exists():
-                return Response(
-                    "Вы уже добавили этот рецепт",
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-
-            serializer = ShopingCartSerializer(
-                recipe, data=request.data, context={"request": request}
-            )
-            serializer.is_valid(raise_exception=True)
-            ShoppingCart.objects.create(user=request.user, recipe=recipe)
-            headers = self.get_success_headers(serializer.data)
-            return Response(
-                {"Success": "Успешное добавление рецепта в список покупок"},
-                status=status.HTTP_201_CREATED,
-                headers=headers,
-            )
-
-        if request.method == "DELETE":
-            if not ShoppingCart.objects.filter(
-                user=request.user, recipe=recipe
-            ).exists():
-                return Response(
-                    "Вы уже удалили этот рецепт",
-                    status=status.HTTP_400_BAD_REQUEST,
-                )
-            get_object_or_404(
-                ShoppingCart, user=request.user, recipe=recipe
-            ).delete()
-            return Response(
-                {"detail": "Успешное удаление рецепта из списка покупок"},
-                status=status.HTTP_204_NO_CONTENT,
-            )
         return Response(
-            {"detail": "-__-"},
+            *toggles.toggle_recipe(
+                request.user,
+                request.method,
+                "shopping_cart",
+                int(kwargs["pk"]),
+            )
         )
 
     @action(
@@ -278,46 +253,137 @@ class RecipeViewSet(viewsets.ModelViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def download_shopping_cart(self, request):
-        ingredients = (
-            ShoppingCart.objects.filter(user=request.user.id)
-            .values_list(
-                "recipe__ingredients__name",
-                "recipe__ingredients__measurement_unit",
+        export_format = request.query_params.get("format", "pdf")
+        exporter = EXPORTERS.get(export_format)
+        if exporter is None:
+            return Response(
+                {"format": [f"Доступные форматы: {', '.join(EXPORTERS)}"]},
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            .distinct()
-            .annotate(total=Sum("recipe__ingredients_recipe__amount"))
-        )
-        buffer = io.BytesIO()
-        path = "data"
-        font = TTFont(
-            "Arial",
-            os.path.join(path, "Arial.ttf"),
+        ingredients = get_ingredients(request.user)
+        if exporter.streaming:
+            response = StreamingHttpResponse(
+                exporter.export(ingredients),
+                content_type=exporter.content_type,
+            )
+        else:
+            response = HttpResponse(
+                exporter.render(ingredients),
+                content_type=exporter.content_type,
+            )
+        response["Content-Disposition"] = (
+            f'attachment; filename="{exporter.filename}"'
         )
-        pdfmetrics.registerFont(font)
-        s = Canvas(buffer)
-        s.setFont("Arial", 35)
-        s.setPageSize((650, 500))
-        start_y = 400
-        start_x = 10
-        s.drawString(10, 450, "Ваш список ингредиентов:")
-        s.setFont("Arial", 20)
-        page = 1
-        for ing in ingredients:
-            start_y -= 50
-            s.drawString(
-                start_x,
-                start_y,
-                "{}, мера - {}, количество - {}.".format(*ing),
+        return response
+
+
+class ShoppingListExportViewSet(
+    mixins.CreateModelMixin,
+    mixins.RetrieveModelMixin,
+    viewsets.GenericViewSet,
+):
+    """
+    Renders the shopping list in the background:
+    POST starts a job, GET polls its status, download returns the file.
+    """
+
+    serializer_class = ShoppingListExportSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_queryset(self):
+        return ShoppingListExport.objects.filter(user=self.request.user)
+
+    def create(self, request, *args, **kwargs):
+        response = super().create(request, *args, **kwargs)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return response
+
+    def get_object(self):
+        return fail_stale(super().get_object())
+
+    def perform_create(self, serializer):
+        expire_exports(self.get_queryset())
+        enqueue_export(serializer.save(user=self.request.user))
+
+    @action(detail=True, methods=["get"])
+    def download(self, request, **kwargs):
+        export = self.get_object()
+        if export.status != ShoppingListExport.DONE:
+            return Response(
+                "Файл еще не готов",
+                status=status.HTTP_400_BAD_REQUEST,
             )
-            if start_y == 50:
-                page += 1
-                s.showPage()
-                s.setFont("Arial", 35)
-                s.drawString(10, 450, f"Страница - {page}")
-                s.setFont("Arial", 20)
-                start_y = 400
-        s.save()
-        buffer.seek(0)
         return FileResponse(
-            buffer, as_attachment=True, filename="Shopping_list.pdf"
+            export.file.open("rb"),
+            as_attachment=True,
+            filename=EXPORTERS[export.format].filename,
+        )
+
+
+def existing_targets(operations):
+    """
+    (type, id) of the recipes and users the operations point to,
+    looked up with one UNION ALL query.
+    """
+    recipe_ids = [op["id"] for op in operations if op["type"] != "subscribe"]
+    user_ids = [op["id"] for op in operations if op["type"] == "subscribe"]
+    kind = CharField()
+    rows = (
+        Recipe.objects.filter(id__in=recipe_ids)
+        .order_by()
+        .annotate(kind=Value("recipe", output_field=kind))
+        .values_list("id", "kind")
+        .union(
+            User.objects.filter(id__in=user_ids)
+            .order_by()
+            .annotate(kind=Value("user", output_field=kind))
+            .values_list("id", "kind"),
+            all=True,
         )
+    )
+    return {(kind, id) for id, kind in rows}
+
+
+class BatchView(APIView):
+    """
+    Applies a queue of favorite, shopping cart and subscribe operations
+    in one transaction with one statement per operation type and
+    returns a status for every operation.
+    """
+
+    permission_classes = (IsAuthenticated,)
+
+    def post(self, request):
+        serializer = BatchSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        operations = serializer.validated_data["operations"]
+        existing = existing_targets(operations)
+        results = [dict(operation) for operation in operations]
+        groups = defaultdict(list)
+        for result in results:
+            kind = "user" if result["type"] == "subscribe" else "recipe"
+            if (
+                kind == "user"
+                and result["action"] == "add"
+                and result["id"] == request.user.id
+            ):
+                result["status"] = status.HTTP_400_BAD_REQUEST
+                result["detail"] = toggles.SELF_SUBSCRIBE
+            elif (kind, result["id"]) not in existing:
+                result["status"] = status.HTTP_404_NOT_FOUND
+                result["detail"] = "Страница не найдена."
+            else:
+                groups[result["type"], result["action"]].append(result)
+        with transaction.atomic():
+            for key, group in groups.items():
+                target_type, target_action = key
+                toggle = getattr(toggles.TOGGLES[target_type], target_action)
+                changed = set(
+                    toggle(request.user.id, [item["id"] for item in group])
+                )
+                outcomes = toggles.OUTCOMES[key]
+                for item in group:
+                    item["status"], item["detail"] = outcomes[
+                        item["id"] not in changed
+                    ]
+        return Response({"results": results})
@@ -49,6 +49,8 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
+    "api.metrics.MetricsMiddleware",
+    "api.middleware.QueryTimingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
@@ -143,13 +145,58 @@ MEDIA_ROOT = os.path.join(BASE_DIR, "mediafile")
 AUTH_USER_MODEL = "users.User"
 
 
+# Cache
+# Use a shared backend (file based, database or memcached) when running
+# several gunicorn workers, so signal based invalidation reaches all of them.
+
+CACHES = {
+    "default": {
+        "BACKEND": os.getenv(
+            "CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.getenv("CACHE_LOCATION", default="foodgram"),
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+    "responses": {
+        "BACKEND": os.getenv(
+            "RESPONSE_CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.getenv(
+            "RESPONSE_CACHE_LOCATION", default="foodgram-responses"
+        ),
+        "OPTIONS": {"MAX_ENTRIES": 10000},
+    },
+    "shopping_lists": {
+        "BACKEND": os.getenv(
+            "SHOPPING_LIST_CACHE_BACKEND",
+            default="django.core.cache.backends.locmem.LocMemCache",
+        ),
+        "LOCATION": os.getenv(
+            "SHOPPING_LIST_CACHE_LOCATION", default="foodgram-shopping-lists"
+        ),
+        "OPTIONS": {"MAX_ENTRIES": 100},
+    },
+}
+
+
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework.authentication.TokenAuthentication",
+        "api.authentication.CachedTokenAuthentication",
     ),
     "DEFAULT_PERMISSION_CLASSES": [
         "rest_framework.permissions.IsAuthenticated",
     ],
+    "DEFAULT_RENDERER_CLASSES": [
+        "api.renderers.FastJSONRenderer",
+        "rest_framework.renderers.BrowsableAPIRenderer",
+    ],
+    "DEFAULT_PARSER_CLASSES": [
+        "api.parsers.FastJSONParser",
+        "rest_framework.parsers.FormParser",
+        "rest_framework.parsers.MultiPartParser",
+    ],
     "DEFAULT_PAGINATION_CLASS": [
         "api.pagination.CustomPaginator",
     ],
@@ -161,6 +208,10 @@ REST_FRAMEWORK = {
 }
 
 
+TOKEN_CACHE_SIZE = 10000
+
+TOKEN_CACHE_TIMEOUT = 5 * 60
+
 DJOSER = {
     "EMAIL_FIELD": "email",
     "PASSWORD_FIELD": "password",
@@ -172,3 +223,63 @@ DJOSER = {
 USE_X_FORWARDED_HOST = True
 
 DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
+
+SHOPPING_LIST_CACHE_ALIAS = "shopping_lists"
+
+SHOPPING_LIST_CACHE_TIMEOUT = 60 * 60
+
+SHOPPING_LIST_EXPORT_WORKERS = int(
+    os.getenv("SHOPPING_LIST_EXPORT_WORKERS", default=2)
+)
+
+# Jobs not done after this many seconds are failed, the process that had
+# them on its executor is gone.
+SHOPPING_LIST_EXPORT_TIMEOUT = 10 * 60
+
+SHOPPING_LIST_EXPORT_TTL = int(
+    os.getenv("SHOPPING_LIST_EXPORT_TTL", default=24 * 60 * 60)
+)
+
+INGREDIENT_SEARCH_LIMIT = 100
+
+INGREDIENT_INDEX_TTL = 5 * 60
+
+REFERENCE_CACHE_TIMEOUT = 60 * 60
+
+REFERENCE_MAX_AGE = 60
+
+ESTIMATED_COUNT_THRESHOLD = 100000
+
+RECIPE_IMAGE_MAX_SIZE = 5 * 1024 * 1024
+
+RECIPE_IMAGE_MAX_DIMENSION = 6000
+
+RECIPE_IMAGE_WIDTHS = {"thumbnail": 480, "full": 1280}
+
+RECIPE_IMAGE_FORMATS = ("webp",)
+
+RECIPE_IMAGE_QUALITY = 80
+
+RECIPE_IMAGE_WORKERS = int(os.getenv("RECIPE_IMAGE_WORKERS", default=2))
+
+RECIPE_STATE_CACHE_TIMEOUT = 60 * 60
+
+RESPONSE_CACHE_ALIAS = "responses"
+
+RESPONSE_CACHE_TIMEOUT = 10 * 60
+
+REQUEST_TIMING_SAMPLE_RATE = float(
+    os.getenv("REQUEST_TIMING_SAMPLE_RATE", default=0)
+)
+
+SLOW_REQUEST_MS = 500
+
+SLOW_REQUEST_QUERIES = 30
+
+SLOW_QUERY_MS = 100
+
+ASYNC_VIEWS = os.getenv("ASYNC_VIEWS", default="") == "1"
+
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", default="")
+
+BATCH_MAX_OPERATIONS = 500
@@ -1,22 +1,98 @@
+import csv
 import json
 import os
+import time
 
-from django.core.management.base import BaseCommand
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
 from recipes.models import Ingredient
+from recipes.signals import ingredients_changed
 
 path = "data"
+CHUNK_SIZE = 64 * 1024
+
+
+def iter_json(f):
+    """
+    Yields the objects of a top-level JSON array without loading
+    the whole file into memory.
+    """
+    decoder = json.JSONDecoder()
+    buffer = f.read(CHUNK_SIZE).lstrip()
+    if not buffer.startswith("["):
+        raise CommandError("Ожидался JSON массив")
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        if buffer.startswith("]"):
+            return
+        try:
+            row, end = decoder.raw_decode(buffer)
+        except ValueError:
+            chunk = f.read(CHUNK_SIZE)
+            if not chunk:
+                raise CommandError("Неожиданный конец JSON файла")
+            buffer += chunk
+            continue
+        buffer = buffer[end:]
+        yield row.get("name"), row.get("measurement_unit")
+
+
+def iter_csv(f):
+    for row in csv.reader(f):
+        if row:
+            yield row[0], row[1]
 
 
 class Command(BaseCommand):
-    help = "load ingredients to db"
+    help = "load ingredients to db from json or csv"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "file",
+            nargs="?",
+            default=os.path.join(path, "ingredients.json"),
+            help="Path to a .json or .csv file.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
 
     def handle(self, *args, **options):
-        with open(
-            os.path.join(path, "ingredients.json"), "r", encoding="utf-8"
-        ) as f:
-            data = json.load(f)
-            for row in data:
-                Ingredient.objects.get_or_create(
-                    name=row.get("name"),
-                    measurement_unit=row.get("measurement_unit"),
-                )
+        file = options["file"]
+        batch_size = options["batch_size"]
+        reader = iter_csv if file.endswith(".csv") else iter_json
+        start = time.monotonic()
+        total = created = 0
+        with open(file, "r", encoding="utf-8") as f, transaction.atomic():
+            existing = set(
+                Ingredient.objects.values_list("name", "measurement_unit")
+            )
+            batch = []
+            for row in reader(f):
+                total += 1
+                if row in existing:
+                    continue
+                existing.add(row)
+                batch.append(Ingredient(name=row[0], measurement_unit=row[1]))
+                if len(batch) == batch_size:
+                    created += self.insert(batch, total, start)
+                    batch = []
+            created += self.insert(batch, total, start)
+            if created:
+                ingredients_changed.send(sender=Ingredient)
+        elapsed = time.monotonic() - start
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Добавлено {created} из {total} строк за {elapsed:.2f} с "
+                f"({total / max(elapsed, 1e-6):.0f} строк/с)"
+            )
+        )
+
+    def insert(self, batch, total, start):
+        if not batch:
+            return 0
+        Ingredient.objects.bulk_create(batch)
+        elapsed = max(time.monotonic() - start, 1e-6)
+        self.stdout.write(
+            f"Обработано {total} строк, {total / elapsed:.0f} строк/с"
+        )
+        return len(batch)
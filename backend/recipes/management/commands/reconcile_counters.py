@@ -0,0 +1,57 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from recipes.models import Favorite, Recipe, ShoppingCart
+from users.models import Subscribe, User
+
+
+def count_by(model, field):
+    return Coalesce(
+        Subquery(
+            model.objects.filter(**{field: OuterRef("pk")})
+            .order_by()
+            .values(field)
+            .annotate(count=Count("id"))
+            .values("count")
+        ),
+        0,
+    )
+
+
+COUNTERS = (
+    (Recipe, "favorites_count", Favorite, "recipe"),
+    (Recipe, "shopping_cart_count", ShoppingCart, "recipe"),
+    (User, "recipes_count", Recipe, "author"),
+    (User, "followers_count", Subscribe, "author"),
+)
+
+
+class Command(BaseCommand):
+    help = "recount denormalized counters and repair drifted rows"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--dry-run",
+            action="store_true",
+            help="Only report drifted rows.",
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            for model, field, source, source_field in COUNTERS:
+                drifted = list(
+                    model.objects.annotate(
+                        actual=count_by(source, source_field)
+                    )
+                    .exclude(**{field: F("actual")})
+                    .values_list("pk", flat=True)
+                )
+                if drifted and not options["dry_run"]:
+                    model.objects.filter(pk__in=drifted).update(
+                        **{field: count_by(source, source_field)}
+                    )
+                self.stdout.write(
+                    f"{model._meta.model_name}.{field}: "
+                    f"{len(drifted)} drifted rows"
+                )
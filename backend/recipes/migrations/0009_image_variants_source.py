@@ -0,0 +1,26 @@
+from django.db import migrations
+
+
+def add_source(apps, schema_editor):
+    """
+    Existing variants were built from the current image. Without the source
+    they would not be served until rebuilt.
+    """
+    Recipe = apps.get_model("recipes", "Recipe")
+    recipes = list(
+        Recipe.objects.exclude(image_variants={}).only("image", "image_variants")
+    )
+    for recipe in recipes:
+        recipe.image_variants["source"] = recipe.image.name
+    Recipe.objects.bulk_update(recipes, ["image_variants"], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_document'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_source, migrations.RunPython.noop),
+    ]
@@ -1,8 +1,10 @@
 from colorfield.fields import ColorField
 from django.core.validators import MaxValueValidator, MinValueValidator
 from django.db import models
+from django.db.models import Exists, OuterRef, Prefetch, Value
+from django.db.models.expressions import RawSQL
 
-from users.models import User
+from users.models import SkipOnSaveMixin, Subscribe, User
 
 
 class Ingredient(models.Model):
@@ -36,7 +38,82 @@ class Tag(models.Model):
         return f"{self.name}, {self.color}, {self.slug}"
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+    def with_related(self):
+        """
+        Prefetch everything RecipeReadSerializer renders, so a page
+        of recipes costs a fixed number of queries.
+        """
+        return self.prefetch_related(
+            "tags",
+            Prefetch(
+                "ingredients_recipe",
+                queryset=IngredientRecipe.objects.select_related(
+                    "ingredient"
+                ).order_by("ingredient_id"),
+            ),
+        )
+
+    def with_authors(self, user):
+        """
+        Fetch recipe authors with is_subscribed for the given user.
+        """
+        if not user.is_authenticated:
+            return self.select_related("author")
+        return self.prefetch_related(
+            Prefetch(
+                "author",
+                queryset=User.objects.annotate(
+                    is_subscribed=Exists(
+                        Subscribe.objects.filter(
+                            user=user, author=OuterRef("pk")
+                        )
+                    )
+                ),
+            )
+        )
+
+    def with_documents(self, user):
+        """
+        Recipe rows with the prerendered document and is_author_subscribed
+        for the given user, a page of recipes is served by one query.
+        """
+        if not user.is_authenticated:
+            return self.annotate(
+                is_author_subscribed=Value(
+                    False, output_field=models.BooleanField()
+                )
+            )
+        return self.annotate(
+            is_author_subscribed=Exists(
+                Subscribe.objects.filter(
+                    user=user, author=OuterRef("author_id")
+                )
+            )
+        )
+
+    def latest_per_author(self, author_ids, limit):
+        """
+        The newest `limit` recipes of every given author in one query,
+        ranked with ROW_NUMBER() partitioned by author.
+        """
+        if not author_ids:
+            return self.none()
+        placeholders = ", ".join(["%s"] * len(author_ids))
+        return self.filter(
+            id__in=RawSQL(
+                "SELECT id FROM ("
+                "SELECT id, ROW_NUMBER() OVER ("
+                "PARTITION BY author_id ORDER BY id DESC"
+                f") AS row_number FROM {self.model._meta.db_table} "
+                f"WHERE author_id IN ({placeholders})"
+                ") AS ranked WHERE row_number <= %s",
+                (*author_ids, limit),
+            )
+        )
+
+
+class Recipe(SkipOnSaveMixin, models.Model):
     author = models.ForeignKey(
         User,
         on_delete=models.CASCADE,
@@ -45,6 +122,12 @@ class Recipe(models.Model):
     )
     name = models.CharField("Название рецепта", max_length=200)
     image = models.ImageField("Картинка", upload_to="")
+    image_variants = models.JSONField(
+        "Размеры картинки", default=dict, blank=True, editable=False
+    )
+    document = models.JSONField(
+        "Документ для чтения", default=dict, blank=True, editable=False
+    )
     text = models.TextField("Описание рецепта")
     ingredients = models.ManyToManyField(
         Ingredient,
@@ -67,11 +150,26 @@ class Recipe(models.Model):
         ],
         verbose_name="Время приготовления",
     )
+    favorites_count = models.PositiveIntegerField(
+        "В избранном", default=0, editable=False
+    )
+    shopping_cart_count = models.PositiveIntegerField(
+        "В списках покупок", default=0, editable=False
+    )
+    # Variants are written by the image worker.
+    skip_on_save = ("favorites_count", "shopping_cart_count", "image_variants")
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         ordering = ("-id",)
         verbose_name = "Рецепт"
         verbose_name_plural = "Рецепты"
+        indexes = [
+            models.Index(
+                fields=["author", "-id"], name="recipe_author_id_idx"
+            ),
+        ]
 
     def __str__(self):
         return self.name
@@ -97,6 +195,12 @@ class IngredientRecipe(models.Model):
     class Meta:
         verbose_name = "Ингредиент в рецепте"
         verbose_name_plural = "Ингредиенты в рецепте"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["recipe", "ingredient"],
+                name="unique_ingredient_recipe",
+            )
+        ]
 
     def __str__(self):
         return f"{self.ingredient}{self.recipe}{self.amount}"
@@ -154,3 +258,46 @@ class ShoppingCart(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.recipe.name}"
+
+
+class ShoppingListExport(models.Model):
+    PENDING = "pending"
+    RUNNING = "running"
+    DONE = "done"
+    FAILED = "failed"
+    STATUS_CHOICES = (
+        (PENDING, "В очереди"),
+        (RUNNING, "Формируется"),
+        (DONE, "Готов"),
+        (FAILED, "Ошибка"),
+    )
+    FORMAT_CHOICES = (
+        ("pdf", "PDF"),
+        ("txt", "TXT"),
+        ("csv", "CSV"),
+        ("json", "JSON"),
+    )
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name="shopping_list_exports",
+        verbose_name="Пользователь",
+    )
+    format = models.CharField(
+        "Формат", max_length=10, choices=FORMAT_CHOICES, default="pdf"
+    )
+    status = models.CharField(
+        "Статус", max_length=10, choices=STATUS_CHOICES, default=PENDING
+    )
+    file = models.FileField("Файл", upload_to="shopping_lists/", blank=True)
+    error = models.TextField("Ошибка", blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ("-id",)
+        verbose_name = "Выгрузка списка покупок"
+        verbose_name_plural = "Выгрузки списка покупок"
+
+    def __str__(self):
+        return f"{self.user.username} - {self.format} - {self.status}"
@@ -0,0 +1,43 @@
+# Generated by Django 3.2 on 2026-10-18 02:39
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_followers(apps, schema_editor):
+    User = apps.get_model("users", "User")
+    Subscribe = apps.get_model("users", "Subscribe")
+    User.objects.update(
+        followers_count=Coalesce(
+            Subquery(
+                Subscribe.objects.filter(author=OuterRef("pk"))
+                .order_by()
+                .values("author")
+                .annotate(count=Count("id"))
+                .values("count")
+            ),
+            0,
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_alter_user_options'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='followers_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Подписчиков'),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='recipes_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Рецептов'),
+        ),
+        migrations.RunPython(count_followers, migrations.RunPython.noop),
+    ]
@@ -3,7 +3,31 @@ from django.core.validators import RegexValidator
 from django.db import models
 
 
-class User(AbstractUser):
+class SkipOnSaveMixin:
+    """
+    Leaves the fields in skip_on_save out of full saves of existing rows.
+    They are only changed with F() updates, which the stale values of a
+    loaded instance would otherwise overwrite.
+    """
+
+    skip_on_save = ()
+
+    def save(self, *args, **kwargs):
+        if (
+            not args
+            and not self._state.adding
+            and kwargs.get("update_fields") is None
+        ):
+            kwargs["update_fields"] = [
+                field.name
+                for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.skip_on_save
+            ]
+        super().save(*args, **kwargs)
+
+
+class User(SkipOnSaveMixin, AbstractUser):
     username = models.CharField(
         "Псевдоним",
         max_length=150,
@@ -23,6 +47,13 @@ class User(AbstractUser):
     )
     first_name = models.CharField("Имя", max_length=150, blank=False)
     last_name = models.CharField("Фамилия", max_length=150, blank=False)
+    recipes_count = models.PositiveIntegerField(
+        "Рецептов", default=0, editable=False
+    )
+    followers_count = models.PositiveIntegerField(
+        "Подписчиков", default=0, editable=False
+    )
+    skip_on_save = ("recipes_count", "followers_count")
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["username", "first_name", "last_name"]
 